@@ -3,6 +3,10 @@
 
 import re
 import base64
+import hashlib
+import weakref
+import types
+from decimal import Decimal
 from collections import namedtuple
 
 from exceptions import ParseError, ValidateError, XMLError, GenerateError
@@ -12,6 +16,11 @@ FieldEntry = namedtuple("FieldEntry", ["name", "type", "min", "max", "mutex_grou
 
 AttributeEntry = namedtuple("AttributeEntry", ["name", "type", "required"])
 
+# Separators for the canonical fingerprint encoding.
+_FP_NONE = b"\x00"
+_FP_OPEN = b"\x01"
+_FP_CLOSE = b"\x02"
+
 class _BaseElemType(object):
 
 	_tag = None
@@ -19,11 +28,63 @@ class _BaseElemType(object):
 
 	_attrib_defs = None
 
+	# Elements without attribute definitions share this (read-only) empty
+	# mapping, rather than carrying a dict each.
+	attrib = types.MappingProxyType({})
+
+	# A weakref to the element this one is a field or attribute of, so
+	# that edits can clear the cached fingerprints above them. (Weak, so
+	# that a message isn't a reference cycle, and is freed as soon as it's
+	# dropped.)
+	_parent = None
+	_fingerprint_cache = None
+
 	def __init__(self, tag, data=None, ns=None):
 
 		self._tag=tag
 		self._ns=ns
 
+		# Per-instance, so that nothing mutable is shared between messages.
+		if self._attrib_defs is not None:
+			self.attrib = dict()
+
+	def __eq__(self, other):
+
+		if not isinstance(other, _BaseElemType):
+			return NotImplemented
+
+		return self.fingerprint() == other.fingerprint()
+
+	def __hash__(self):
+
+		# Note that this changes if the message is edited, so don't edit
+		# messages while they are in a set or used as dict keys.
+		return hash(self.fingerprint())
+
+	def __getstate__(self):
+
+		# Cached fingerprints are only meaningful within this process, and
+		# parent links are rebuilt on the way back in (so pickling a field
+		# doesn't drag the rest of the message along).
+		state = self.__dict__.copy()
+		state.pop("_fingerprint_cache", None)
+		state.pop("_parent", None)
+		return state
+
+	def __setstate__(self, state):
+
+		self.__dict__.update(state)
+		parent = weakref.ref(self)
+		for child in self._children():
+			child._parent = parent
+
+	def _children(self):
+
+		if self._attrib_defs is not None:
+			for this_attrib in self.attrib.values():
+				if isinstance(this_attrib, _BaseElemType):
+					yield this_attrib
+
 	def _whoami(self, path_in=None):
 
 		my_name = self.__class__.__name__ if self._tag is None else self._tag
@@ -47,10 +108,13 @@ class _BaseElemType(object):
 					raise ParseError(f"{self._whoami()} : Missing required attribute {attrib_def.name}")
 
 				try:
-					self.attrib[attrib_def.name] = attrib_def.type(data = this_attrib_data)
+					this_attrib = attrib_def.type(attrib_def.name, data = this_attrib_data)
 				except:
 					raise ParseError(f"{self._whoami()} : Could not parse attribute {attrib_def.name}")
 
+				this_attrib._parent = weakref.ref(self)
+				self.attrib[attrib_def.name] = this_attrib
+
 		# Parse the rest of the data.
 		self._do_parse(node_in, path_in, force)
 
@@ -62,6 +126,9 @@ class _BaseElemType(object):
 		# Validate attribs
 		if self._attrib_defs is not None:
 			for attrib_def in self._attrib_defs:
+				if attrib_def.name not in self.attrib and not attrib_def.required:
+					continue
+
 				try:
 					assert(attrib_def.name in self.attrib)
 					this_attrib = self.attrib[attrib_def.name]
@@ -111,13 +178,82 @@ class _BaseElemType(object):
 
 		return xml
 
+	def fingerprint(self):
+
+		"""
+		Canonical content hash of this element and everything below it.
+		Independent of XML formatting; fields are hashed in _field_defs
+		order and attributes in _attrib_defs order.
+
+		Cached until this element, or anything below it, is changed by set()
+		or a field assignment. In-place edits of lists or attrib dicts aren't
+		seen, so call invalidate_fingerprint() on the element after making
+		those.
+
+		An element only knows the last element it was assigned to. If the
+		same element is put into two messages, edits to it only clear the
+		cache of the last one; copy.deepcopy() it instead, or call
+		invalidate_fingerprint() on the other message.
+		"""
+
+		cached = self._fingerprint_cache
+		if cached is not None:
+			return cached
+
+		h = hashlib.blake2b(digest_size=32)
+		h.update(f"{type(self).__module__}.{type(self).__qualname__}".encode())
+		h.update(_FP_OPEN)
+		h.update(str(self._tag).encode())
+		h.update(_FP_OPEN)
+
+		# Attributes
+		if self._attrib_defs is not None:
+			for attrib_def in self._attrib_defs:
+				this_attrib = self.attrib.get(attrib_def.name)
+				h.update(_FP_NONE if this_attrib is None else this_attrib.fingerprint())
+		h.update(_FP_CLOSE)
+
+		# The rest of the data.
+		self._do_fingerprint(h)
+
+		digest = h.digest()
+		self._fingerprint_cache = digest
+
+		return digest
+
+	def invalidate_fingerprint(self):
+
+		"""
+		Forget the cached fingerprints of this element and everything above it.
+		"""
+
+		# If an element has a cached fingerprint, so does everything below
+		# it (they were hashed to make it). So we can stop at the first
+		# element without one.
+		elem = self
+		while elem is not None and elem._fingerprint_cache is not None:
+			elem._fingerprint_cache = None
+			parent = elem._parent
+			elem = None if parent is None else parent()
+
+	def memory_report(self):
+
+		"""
+		Deep memory footprint of this element and everything below it,
+		broken down by class and by field path. See memory_report.MemoryReport.
+		"""
+
+		# (Imported here, as memory_report depends on this module.)
+		from memory_report import MemoryReport
+
+		return MemoryReport().add(self)
+
 	def generate(self):
 		
 		# Do attributes
 
-		self.attrib = dict()
-
 		if self._attrib_defs is not None:
+			self.attrib = dict()
 			for attrib_def in self._attrib_defs:
 
 				# Decide if we'll include it or not.
@@ -126,6 +262,7 @@ class _BaseElemType(object):
 				if will_generate:
 					this_attrib = attrib_def.type(attrib_def.name)
 					this_attrib.generate()
+					this_attrib._parent = weakref.ref(self)
 					self.attrib[attrib_def.name] = this_attrib
 
 		# Do the rest.
@@ -147,6 +284,10 @@ class _BaseElemType(object):
 
 		raise NotImplementedError("Base class cannot self-populate.")
 
+	def _do_fingerprint(self, h):
+
+		raise NotImplementedError("Base class cannot fingerprint.")
+
 class _BaseDataType(_BaseElemType):
 
 	data = None
@@ -164,6 +305,7 @@ class _BaseDataType(_BaseElemType):
 
 	def set(self, data):
 		self.data = data
+		self.invalidate_fingerprint()
 
 	def get(self):
 		return self.data
@@ -175,9 +317,37 @@ class _BaseDataType(_BaseElemType):
 
 		return (indentlevel * indent) + str(self)
 
+	@classmethod
+	def _do_batch_validation(cls, leaves):
+
+		"""
+		Validates many leaves of this class at once, returning the indices
+		of the ones that fail. Subclasses override this with a tight loop
+		over the data.
+		"""
+
+		failed = []
+
+		for i, leaf in enumerate(leaves):
+			try:
+				leaf._do_validation()
+			except (AssertionError, ValueError, TypeError):
+				failed.append(i)
+
+		return failed
+
+	def _do_fingerprint(self, h):
+
+		if self.data is None:
+			h.update(_FP_NONE)
+		else:
+			data = self.data if type(self.data) == bytes else str(self.data).encode()
+			h.update(len(data).to_bytes(8, "big"))
+			h.update(data)
+
 class _BaseFieldType(_BaseElemType):
 
-	_field_defs = {}
+	_field_defs = ()
 
 	def __init__(self, tag, data=None, ns=None):
 
@@ -188,47 +358,103 @@ class _BaseFieldType(_BaseElemType):
 			raise ValueError(f"{self._whoami()} : Cannot contain data (Contains data {data})")
 		"""
 
+	def __setattr__(self, name, value):
+
+		# Replacing a field changes the content of the message, and the
+		# new value now belongs to us.
+		if not name.startswith("_"):
+			self.invalidate_fingerprint()
+			if isinstance(value, _BaseElemType):
+				value._parent = weakref.ref(self)
+			elif type(value) == list:
+				parent = weakref.ref(self)
+				for v in value:
+					if isinstance(v, _BaseElemType):
+						v._parent = parent
+
+		super().__setattr__(name, value)
+
+	def _children(self):
+
+		yield from super()._children()
+
+		for field_def in self._field_defs:
+			field = getattr(self, field_def.name, None)
+			if field is None:
+				continue
+			for f in (field if type(field) == list else (field,)):
+				if isinstance(f, _BaseElemType):
+					yield f
+
 	def _do_validation(self, path_in=None):
 
-		seen_mutex_groups = set()
+		# Stop at the first structural problem.
+		for error in self._structure_errors():
+			raise ValidateError(f"{self._whoami()} : {error}")
 
+		# validate each field
 		for field_def in self._field_defs:
+			field = getattr(self, field_def.name)
+			if field is None:
+				pass
+			elif field_def.array:
+				for x in field:
+					x.validate(path_in)
+			else:
+				field.validate(path_in)
 
-			field_class = type(field_def)
+		# If all fields validate, return True.
+		return True
+
+	def _structure_errors(self):
+
+		"""
+		Yields a message for each problem with this element's fields
+		(definitions, bounds, mutex groups, types). Doesn't look inside
+		the fields themselves.
+		"""
+
+		seen_mutex_groups = set()
+
+		for field_def in self._field_defs:
 
 			# Check field is defined.
 			try:
 				field = getattr(self, field_def.name)
 			except AttributeError as e:
-				raise ValidateError(f"{self._whoami()} : Missing field {field_def.name} (check class definition)")
+				yield f"Missing field {field_def.name} (check class definition)"
+				continue
 
 			# Check limits are valid
 			if field_def.array:
 				if field_def.min is not None and field_def.min < 0:
-					raise ValidateError(f"{self._whoami()} : Invalid lower bound for {field_def.name}")
+					yield f"Invalid lower bound for {field_def.name}"
+					continue
 				if field_def.max is not None and field_def.max < field_def.min:
-					raise ValidateError(f"{self._whoami()} : Invalid upper bound for {field_def.name}")
+					yield f"Invalid upper bound for {field_def.name}"
+					continue
 			else:
 				if field_def.min not in (0,1) or field_def.max != 1:
-					raise ValidateError(f"{self._whoami()} : Invalid bounds for {field_def.name}")
+					yield f"Invalid bounds for {field_def.name}"
+					continue
 
 			# Check field is within size limits
 			if field_def.array:
-				field_length = 0 if field is None else len(field)
+				field_length = len(field) if type(field) == list else 0 if field is None else 1
 				if field_def.min is not None and field_length < field_def.min:
-					raise ValidateError(f"{self._whoami()} : length of {field_def.name} has lower size bound {field_def.min}, but is defined as length {field_length}.")
+					yield f"length of {field_def.name} has lower size bound {field_def.min}, but is defined as length {field_length}."
 				if field_def.max is not None and field_length > field_def.max:
-					raise ValidateError(f"{self._whoami()} : length of {field_def.name} has upper size bound {field_def.max}, but is defined as length {field_length}.")
+					yield f"length of {field_def.name} has upper size bound {field_def.max}, but is defined as length {field_length}."
 			else:
 				# (This is basically checking that mandatory fields  are defined)
 				if field_def.min > 0 and field is None:
-					raise ValidateError(f"{self._whoami()} : Missing required field {field_def.name}")
+					yield f"Missing required field {field_def.name}"
 
 			# Check mutex groups
 			if field is not None and field_def.mutex_group is not None:
 				if field_def.mutex_group in seen_mutex_groups:
 					fields_in_mutex_group = {fd for fd in self._field_defs if fd.mutex_group == field_def.mutex_group}
-					raise ValidateError(f"{self._whoami()} : Can only contain one from this list: " + ", ".join(fd.name for fd in fields_in_mutex_group))
+					yield "Can only contain one from this list: " + ", ".join(fd.name for fd in fields_in_mutex_group)
 				else:
 					seen_mutex_groups.add(field_def.mutex_group)
 
@@ -236,28 +462,13 @@ class _BaseFieldType(_BaseElemType):
 			if field_def.array:
 				if field is not None:
 					if (type(field) != list):
-						raise ValidateError(f"{self._whoami()} : {field_def.name} expected value of type list, got {type(field).__name__}") 
+						yield f"{field_def.name} expected value of type list, got {type(field).__name__}"
 					elif any(type(f) != field_def.type for f in field):
-						raise ValidateError(f"{self._whoami()} : {field_def.name} expected list of entries of type {field_def.type}, got [{', '.join(type(f).__name__ for f in field)}]")
+						yield f"{field_def.name} expected list of entries of type {field_def.type}, got [{', '.join(type(f).__name__ for f in field)}]"
 			else:
 				if field is not None:
 					if type(field) != field_def.type:
-						raise ValidateError(f"{self._whoami()} : {field_def.name} expected value of type {field_def.type}, got {type(field).__name__}")
-
-
-		# validate each field
-		for field_def in self._field_defs:
-			field = getattr(self, field_def.name)
-			if field is None:
-				pass
-			elif field_def.array:
-				for x in field:
-					x.validate(path_in)
-			else:
-				field.validate(path_in)
-
-		# If all fields validate, return True.
-		return True
+						yield f"{field_def.name} expected value of type {field_def.type}, got {type(field).__name__}"
 
 	def _do_parse(self, node_in, path_in=None, force=False):
 		
@@ -271,9 +482,18 @@ class _BaseFieldType(_BaseElemType):
 		if node_in.tag != self.tag_with_ns():
 			raise ParseError(f"{self._whoami()} : Expected {self.tag_with_ns()}, got {node_in.tag}")
 
+		# Fields are set directly rather than through __setattr__, which
+		# would walk up the tree on every one; invalidate once instead.
+		self.invalidate_fingerprint()
+		parent = weakref.ref(self)
+
 		# Go through tags.
 		for n in node_in:
 
+			# Skip comments, PIs and unexpanded entities (lxml keeps these as children).
+			if type(n.tag) != str:
+				continue
+
 			# Forget the namespace if it's there.
 			tagname = n.tag.rsplit("}", 1)[-1]
 
@@ -289,12 +509,14 @@ class _BaseFieldType(_BaseElemType):
 			new_item = field_def.type(tagname, data=n.text, ns=self._ns)
 			new_item.parse(n, f"{path_in}.{tagname}")
 
+			new_item._parent = parent
+
 			if field_def.array:
 				if getattr(self, field_def.name) is None:
-					setattr(self, field_def.name, [])
+					object.__setattr__(self, field_def.name, [])
 				getattr(self, field_def.name).append(new_item)
 			else:
-				setattr(self, field_def.name, new_item)
+				object.__setattr__(self, field_def.name, new_item)
 
 
 	def _do_xml(self, indentlevel=0, indent="\t"):
@@ -316,6 +538,22 @@ class _BaseFieldType(_BaseElemType):
 		
 		return "\n".join(content)
 
+	def _do_fingerprint(self, h):
+
+		for field_def in self._field_defs:
+			field = getattr(self, field_def.name, None)
+
+			h.update(_FP_OPEN)
+			if field is None:
+				h.update(_FP_NONE)
+			elif field_def.array:
+				h.update(len(field).to_bytes(8, "big"))
+				for f in field:
+					h.update(f.fingerprint())
+			else:
+				h.update(field.fingerprint())
+			h.update(_FP_CLOSE)
+
 	def _do_generate(self):
 
 		# Mutex groups first.
@@ -366,7 +604,7 @@ class _BaseFieldType(_BaseElemType):
 			this_field = field_def.type(field_def.name)
 			this_field.generate()
 
-		# Set the attribute
+		# Set the attribute (which also makes us the new fields' parent)
 		setattr(self, field_def.name, this_field)
 
 
@@ -411,6 +649,29 @@ class _BaseDataType_String(_BaseDataType):
 		if self._length is not None:
 			assert(len(self.data)==self._length)
 
+	@classmethod
+	def _do_batch_validation(cls, leaves):
+
+		fullmatch = None if cls._pattern is None else re.compile(cls._pattern).fullmatch
+		values = cls._values
+		max_len = cls._max
+		min_len = cls._min
+		length = cls._length
+
+		failed = []
+
+		for i, leaf in enumerate(leaves):
+			data = leaf.data
+			if (type(data) != str
+				or (fullmatch is not None and not fullmatch(data))
+				or (values is not None and data not in values)
+				or (max_len is not None and len(data) > max_len)
+				or (min_len is not None and len(data) < min_len)
+				or (length is not None and len(data) != length)):
+				failed.append(i)
+
+		return failed
+
 	def _do_generate(self):
 
 		new_data = None
@@ -448,7 +709,7 @@ class _BaseDataType_B64Binary(_BaseDataType):
 	_min = None
 
 	def set_bin(self, data:bin):
-		self.data = base64.b64encode(data)
+		self.set(base64.b64encode(data))
 
 	def get_bin(self):
 		return base64.b64decode(self.data)
@@ -533,50 +794,85 @@ class _BaseDataType_Decimal(_BaseDataType):
 			if len(d) > 0:
 				assert(d.isdigit())
 
+		assert(len(left_digits) + len(right_digits) > 0)
+
 		# if totaldigits is defined, check it
 		if self._max_totaldigits is not None:
 			assert(len(left_digits) + len(right_digits) <= self._max_totaldigits)
 
 		# if fractiondigits is defined, check it
 		if self._max_fractiondigits is not None:
-			assert(len(left_digits) + len(right_digits) <= self._max_totaldigits)
+			assert(len(right_digits) <= self._max_fractiondigits)
 
 		# if min_inclusive is defined, check it
+		# (Compared as Decimals, so long values aren't rounded.)
 		if self._min_inclusive is not None:
-			assert(self._min_inclusive <= float(self.data))
+			assert(Decimal(str(self._min_inclusive)) <= Decimal(self.data))
 
 		# if max_inclusive is defined, check it
 		if self._max_inclusive is not None:
-			assert(float(self.data) <= self._max_inclusive)
+			assert(Decimal(self.data) <= Decimal(str(self._max_inclusive)))
 		
 		# if pattern is defined, check it
 		if self._pattern is not None:
 			assert(re.fullmatch(self._pattern, self.data))
-			
+
+	# Same rules as the checks in _do_validation
+	_decimal_re = re.compile(r"-?([0-9]*)(?:\.([0-9]*))?")
+
+	@classmethod
+	def _do_batch_validation(cls, leaves):
+
+		decimal_match = cls._decimal_re.fullmatch
+		fullmatch = None if cls._pattern is None else re.compile(cls._pattern).fullmatch
+		max_totaldigits = cls._max_totaldigits
+		max_fractiondigits = cls._max_fractiondigits
+		min_inclusive = None if cls._min_inclusive is None else Decimal(str(cls._min_inclusive))
+		max_inclusive = None if cls._max_inclusive is None else Decimal(str(cls._max_inclusive))
+
+		failed = []
+
+		for i, leaf in enumerate(leaves):
+			data = leaf.data
+			try:
+				m = decimal_match(data)
+				if (m is None
+					or not (m.group(1) or m.group(2))
+					or (max_totaldigits is not None and len(m.group(1)) + len(m.group(2) or "") > max_totaldigits)
+					or (max_fractiondigits is not None and len(m.group(2) or "") > max_fractiondigits)
+					or (min_inclusive is not None and not min_inclusive <= Decimal(data))
+					or (max_inclusive is not None and not Decimal(data) <= max_inclusive)
+					or (fullmatch is not None and not fullmatch(data))):
+					failed.append(i)
+			except (TypeError, ValueError, ArithmeticError):
+				failed.append(i)
+
+		return failed
+
 
 	def _do_generate(self):
 
-		# God this is awful
+		# Patterns can't be sampled directly, so try a few until one fits the
+		# other constraints.
 		if self._pattern:
-			found = False
 			for i in range(100):
-				new_data = gen_utils.string_from_pattern(self._pattern)
-				
-				if self._min_inclusive is not None and float(new_data) < self._min_inclusive:
-					continue
-				if self._max_inclusive is not None and float(new_data) > self._max_inclusive:
+				self.set(gen_utils.string_from_pattern(self._pattern))
+				try:
+					self._do_validation()
+				except (AssertionError, ValueError, ArithmeticError):
 					continue
-				found = True
-			if not found:
-				raise GenerateError(f"{self._whoami()} : Incompatible pattern + bounds definitions")
+				return
+			raise GenerateError(f"{self._whoami()} : Incompatible pattern + bounds definitions")
 
-		else:
+		try:
 			new_data = gen_utils.random_decimal(
 				self._min_inclusive, 
 				self._max_inclusive, 
 				self._max_fractiondigits, 
 				self._max_totaldigits
 			)
+		except ValueError:
+			raise GenerateError(f"{self._whoami()} : Incompatible bounds + digits definitions")
 
 		self.set(new_data)
 
@@ -602,15 +898,33 @@ class _BaseDataType_Date(_BaseDataType):
 		# Pattern is defined by default; check it
 		assert(re.fullmatch(self._pattern, self.data))
 
+	@classmethod
+	def _do_batch_validation(cls, leaves):
+
+		fullmatch = re.compile(cls._pattern).fullmatch
+
+		return [ i for i, leaf in enumerate(leaves) if type(leaf.data) != str or not fullmatch(leaf.data) ]
+
 	def _do_generate(self):
 		
-		new_data = gen_utils.string_from_pattern(self._pattern)
+		# Sample a calendar-valid value directly, unless a subclass has
+		# narrowed the pattern so that it doesn't fit.
+		new_data = self._sample()
+		if not re.fullmatch(self._pattern, new_data):
+			new_data = gen_utils.string_from_pattern(self._pattern)
 		self.set(new_data)
 
+	def _sample(self):
+		return gen_utils.random_date()
+
 class _BaseDataType_Time(_BaseDataType_Date):
 
 	_pattern = r"([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9](\.[0-9]+)?(Z|[+-](0[0-9]|1[0-4]):[0-5][0-9])?"
 
+	# (The pattern allows offsets up to 14:59, but XSD stops at 14:00.)
+	def _sample(self):
+		return gen_utils.random_time(gen_utils.choose_one((0, 3, 6))) + gen_utils.random_tz(14*60, 14*60)
+
 class _BaseDataType_gYear(_BaseDataType_Date):
 
 	# From ISO 8601
@@ -626,6 +940,9 @@ class _BaseDataType_gYear(_BaseDataType_Date):
 	#_pattern = r"^\d{4}(\+(0[0-9]|1[0-3]):[0-5]\d|-(0[0-9]|1[0-1]):[0-5]\d|\+14:00|-12:00|Z)?$"
 	_pattern = r"^[0-9]{4}(\+(0[0-9]|1[0-3]):[0-5][0-9]|-(0[0-9]|1[0-1]):[0-5][0-9]|\+14:00|-12:00|Z)?$"
 
+	def _sample(self):
+		return gen_utils.random_year() + gen_utils.random_tz(14*60, 12*60)
+
 class _BaseDataType_gYearMonth(_BaseDataType_Date):
 
 	# From ISO 8601
@@ -637,6 +954,9 @@ class _BaseDataType_gYearMonth(_BaseDataType_Date):
 	#_pattern = r"^\d{4}-(0[1-9]|1[0-2])(\+(0[0-9]|1[0-3]):[0-5]\d|-(0[0-9]|1[0-1]):[0-5]\d|\+14:00|-12:00|Z)?$"
 	_pattern = r"^[0-9]{4}-(0[1-9]|1[0-2])(\+(0[0-9]|1[0-3]):[0-5][0-9]|-(0[0-9]|1[0-1]):[0-5][0-9]|\+14:00|-12:00|Z)?$"
 
+	def _sample(self):
+		return f"{gen_utils.random_year()}-{gen_utils.random_month()}" + gen_utils.random_tz(14*60, 12*60)
+
 class _BaseDataType_gMonth(_BaseDataType_Date):
 
 	# From ISO 8601
@@ -647,6 +967,9 @@ class _BaseDataType_gMonth(_BaseDataType_Date):
 
 	_pattern = r"^(0[1-9]|1[0-2])(\+(0[0-9]|1[0-3]):[0-5][0-9]|-(0[0-9]|1[0-1]):[0-5][0-9]|\+14:00|-12:00|Z)?$"
 
+	def _sample(self):
+		return gen_utils.random_month() + gen_utils.random_tz(14*60, 12*60)
+
 class _BaseDataType_DateTime(_BaseDataType):
 
 	_pattern_UTC_time = r"[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])T([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9](\.[0-9]{3})?Z"
@@ -679,18 +1002,30 @@ class _BaseDataType_DateTime(_BaseDataType):
 		else:
 			assert(re.fullmatch(self._pattern, self.data))
 
+	@classmethod
+	def _do_batch_validation(cls, leaves):
+
+		if cls._pattern is None:
+			matchers = [ re.compile(p).fullmatch for p in (cls._pattern_UTC_time, cls._pattern_UTC_localtime, cls._pattern_UTC_localtime_offset) ]
+		else:
+			matchers = [ re.compile(cls._pattern).fullmatch ]
+
+		return [ i for i, leaf in enumerate(leaves) if type(leaf.data) != str or not any(m(leaf.data) for m in matchers) ]
+
 	def _do_generate(self):
 		
-		if self._pattern is not None:
-			this_pattern = self._pattern
-		else:
-			this_pattern = gen_utils.choose_one((
-				self._pattern_UTC_time,
-				self._pattern_UTC_localtime,
-				self._pattern_UTC_localtime_offset,
-			))
+		# One of the three default forms: UTC, with an offset (at most
+		# 14:00, as in XSD), or without.
+		new_data = gen_utils.random_datetime(gen_utils.choose_one((
+			"Z",
+			gen_utils.random_tz_offset(14*60, 14*60),
+			"",
+		)))
+
+		# Fall back to the pattern if a subclass's pattern doesn't fit.
+		if self._pattern is not None and not re.fullmatch(self._pattern, new_data):
+			new_data = gen_utils.string_from_pattern(self._pattern)
 
-		new_data = gen_utils.string_from_pattern(this_pattern)
 		self.set(new_data)
 
 class XS_ID(_BaseDataType_String):
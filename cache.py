@@ -0,0 +1,253 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+from exceptions import ParseError
+import parsers
+
+class MessageCache(object):
+
+	"""
+	Content-addressed cache in front of parse_file/parse_xml.
+
+	Messages are keyed by a hash of their raw content plus the version of
+	the message classes (parsers.schema_version()), and stored pickled: the in-memory LRU is bounded by the total
+	size of the pickles (max_bytes), and every lookup returns a fresh copy,
+	so callers can edit what they get back. If directory is given, entries
+	are also written there and survive restarts. (They're pickles, so only
+	use a directory you trust.) The directory is an LRU too, bounded by
+	max_disk_bytes; that's kept to by each cache using it, so caches in
+	several processes sharing one directory can go over it between them.
+
+	A hit skips parsing, and skips validation if the message has been
+	validated before.
+	"""
+
+	def __init__(self, max_bytes=64*1024*1024, directory=None, max_disk_bytes=1024*1024*1024):
+
+		self.max_bytes = max_bytes
+		self.directory = directory
+		self.max_disk_bytes = max_disk_bytes
+
+		self._entries = OrderedDict()
+		self._size = 0
+		self._lock = threading.Lock()
+
+		# Key -> file size for what's on disk, least recently used first.
+		self._disk = OrderedDict()
+		self._disk_size = 0
+
+		self.hits = 0
+		self.disk_hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.disk_evictions = 0
+
+		if directory is not None:
+			os.makedirs(directory, exist_ok=True)
+			self._scan_disk()
+
+	def parse_file(self, filepath, msgtype=None, validate=False):
+
+		try:
+			with open(filepath, "rb") as f:
+				content = f.read()
+		except OSError as e:
+			raise ParseError(str(e))
+
+		return self.parse_xml(content, msgtype, validate)
+
+	def parse_xml(self, xml, msgtype=None, validate=False):
+
+		content = xml.encode("utf-8") if type(xml) == str else xml
+		key = hashlib.sha256(parsers.schema_version().encode() + b"\x00" + content).hexdigest()
+
+		entry = self._get(key)
+
+		if entry is None:
+			msg = parsers.parse_xml(content, msgtype)
+			validated = False
+		else:
+			validated, blob = entry
+			msg = pickle.loads(blob)
+
+		if validate and not validated:
+			msg.validate()
+			validated = True
+		elif entry is not None:
+			return msg
+
+		self._put(key, validated, pickle.dumps(msg, pickle.HIGHEST_PROTOCOL))
+
+		return msg
+
+	def stats(self):
+
+		with self._lock:
+			return {
+				"hits": self.hits,
+				"disk_hits": self.disk_hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"disk_evictions": self.disk_evictions,
+				"entries": len(self._entries),
+				"bytes": self._size,
+				"disk_entries": len(self._disk),
+				"disk_bytes": self._disk_size,
+			}
+
+	def clear(self):
+
+		with self._lock:
+			self._entries.clear()
+			self._size = 0
+
+	def _get(self, key):
+
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				self._entries.move_to_end(key)
+				self.hits += 1
+				return entry
+
+		entry = self._read_disk(key)
+
+		victims = []
+
+		with self._lock:
+			if entry is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+				self.disk_hits += 1
+				self._insert(key, entry)
+				victims = self._note_disk(key, len(entry[1]) + 1)
+
+		self._remove_disk(victims)
+
+		return entry
+
+	def _put(self, key, validated, blob):
+
+		entry = (validated, blob)
+
+		with self._lock:
+			self._insert(key, entry)
+
+		self._write_disk(key, entry)
+
+	def _insert(self, key, entry):
+
+		old = self._entries.pop(key, None)
+		if old is not None:
+			self._size -= len(old[1])
+
+		# Don't let one huge message flush the whole cache.
+		if len(entry[1]) > self.max_bytes:
+			return
+
+		self._entries[key] = entry
+		self._size += len(entry[1])
+
+		while self._size > self.max_bytes:
+			_, (_, blob) = self._entries.popitem(last=False)
+			self._size -= len(blob)
+			self.evictions += 1
+
+	def _path(self, key):
+		return os.path.join(self.directory, f"{key}.pickle")
+
+	def _scan_disk(self):
+
+		# Pick up what earlier runs left behind, oldest first.
+		found = []
+		for name in os.listdir(self.directory):
+			if not name.endswith(".pickle"):
+				continue
+			try:
+				st = os.stat(os.path.join(self.directory, name))
+			except OSError:
+				continue
+			found.append((st.st_mtime, name[:-len(".pickle")], st.st_size))
+
+		victims = []
+		for _, key, size in sorted(found):
+			victims += self._note_disk(key, size)
+
+		self._remove_disk(victims)
+
+	def _note_disk(self, key, size):
+
+		# Record a use of an entry on disk. Returns the keys whose files
+		# now need to go; the caller removes them, outside the lock.
+
+		old = self._disk.pop(key, None)
+		if old is not None:
+			self._disk_size -= old
+
+		self._disk[key] = size
+		self._disk_size += size
+
+		victims = []
+		while self._disk_size > self.max_disk_bytes:
+			victim, victim_size = self._disk.popitem(last=False)
+			self._disk_size -= victim_size
+			self.disk_evictions += 1
+			victims.append(victim)
+
+		return victims
+
+	def _remove_disk(self, keys):
+
+		for key in keys:
+			try:
+				os.remove(self._path(key))
+			except OSError:
+				pass
+
+	def _read_disk(self, key):
+
+		if self.directory is None:
+			return None
+
+		try:
+			with open(self._path(key), "rb") as f:
+				data = f.read()
+			# (So that the next run knows it's been used.)
+			os.utime(self._path(key))
+		except OSError:
+			return None
+
+		return (data[:1] == b"\x01", data[1:])
+
+	def _write_disk(self, key, entry):
+
+		if self.directory is None:
+			return
+
+		validated, blob = entry
+
+		# As in memory, one huge message isn't allowed to flush the rest.
+		if len(blob) + 1 > self.max_disk_bytes:
+			return
+
+		path = self._path(key)
+		tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+		with open(tmp_path, "wb") as f:
+			f.write(b"\x01" if validated else b"\x00")
+			f.write(blob)
+
+		# Atomic, so concurrent readers never see a partial entry.
+		os.replace(tmp_path, path)
+
+		with self._lock:
+			victims = self._note_disk(key, len(blob) + 1)
+
+		self._remove_disk(victims)
@@ -0,0 +1,664 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+"""
+Long-running parse/validate/convert service.
+
+Importing the message classes is the slowest part of a short script, so
+the daemon does it once, and then forks a pool of workers which share
+the loaded classes. Requests are served over a Unix socket, localhost
+HTTP, or both:
+
+    python daemon.py --socket /tmp/iso20022.sock --http 8020
+
+Unix socket: one compact JSON request per line, and one JSON response
+per line, in the same order. Requests on one connection are handed to
+the pool as they arrive, so a client can stream them without waiting.
+
+HTTP: POST /parse, /validate or /convert with a JSON request body, and
+an "Authorization: Bearer <token>" header. The token is kept in a file
+only its owner can read (see --token-file and load_token()).
+
+Either way, a request is an object, e.g.
+
+    {"op": "validate", "path": "/data/msg.xml", "engine": "xsd"}
+    {"op": "parse", "xml": "<Document ...>", "validate": true}
+
+or a list of them (a batch), which is spread across the pool and answered
+with a list. Responses look like
+
+    {"ok": true, "ns": "...", "tag": "Document", "fingerprint": "..."}
+    {"ok": false, "issues": [["Document.Msg.GrpHdr.MsgId", "Invalid value"]]}
+    {"ok": false, "error": "ParseError", "message": "..."}
+
+Paths are read by the daemon, so anyone who can connect can read what
+the daemon can. The socket is only accessible to its owner, and HTTP only
+listens on localhost and turns away requests without the token.
+
+DaemonClient talks to a running daemon with the same calls as the library.
+"""
+
+import os
+import hmac
+import json
+import stat
+import queue
+import signal
+import socket
+import secrets
+import threading
+import socketserver
+import multiprocessing
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from collections import namedtuple
+
+from exceptions import ParseError, ValidateError, XMLError, GenerateError
+
+OPS = ("parse", "validate", "convert")
+
+ParsedSummary = namedtuple("ParsedSummary", ["ns", "tag", "fingerprint"])
+
+# The same as validation.ValidationIssue. (Importing that would pull the
+# message classes into the client, which is what the daemon is there to avoid.)
+ValidationIssue = namedtuple("ValidationIssue", ["path", "message"])
+
+_ERRORS = {
+	"ParseError": ParseError,
+	"ValidateError": ValidateError,
+	"XMLError": XMLError,
+	"GenerateError": GenerateError,
+}
+
+def __dumps__(obj):
+	return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def __error__(error, message):
+	return {"ok": False, "error": error, "message": message}
+
+def load_token(path):
+
+	"""
+	The HTTP token kept in path. If the file doesn't exist, it's created
+	(readable only by its owner) with a new random token.
+	"""
+
+	path = os.path.expanduser(path)
+
+	try:
+		fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+	except FileExistsError:
+		if os.stat(path).st_mode & 0o077:
+			raise ValueError(f"{path} : Token file must only be accessible to its owner")
+		with open(path) as f:
+			token = f.read().strip()
+		if not token:
+			raise ValueError(f"{path} : Token file is empty")
+		return token
+
+	token = secrets.token_urlsafe(32)
+	with os.fdopen(fd, "w") as f:
+		f.write(token + "\n")
+
+	return token
+
+#
+# Worker side.
+#
+
+def __init_worker__(preload, snapshot=None):
+
+	# Ctrl-C is for the parent; it shuts the pool down.
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+	if snapshot is not None:
+		import parsers
+		parsers.use_snapshot(snapshot)
+
+	__load_classes__(preload)
+
+def __load_classes__(preload):
+
+	import parsers
+	import validation
+
+	# Resolve the message classes we expect to see, so that nothing is
+	# built lazily while serving. (From the snapshot, if there is one.)
+	classes = parsers.message_classes()
+	for msgtype in preload:
+		getattr(classes, msgtype.replace(".", "_").upper()).Document
+
+def __load__(request):
+
+	import parsers
+
+	if request.get("path") is not None:
+		return parsers.parse_file(request["path"], request.get("msgtype"))
+	elif request.get("xml") is not None:
+		return parsers.parse_xml(request["xml"], request.get("msgtype"))
+	else:
+		raise ParseError("Request has no xml or path")
+
+def __run_request__(request):
+
+	import validation
+	import mutate
+
+	if type(request) != dict:
+		return __error__("RequestError", "Request must be a JSON object")
+
+	op = request.get("op")
+
+	try:
+
+		if op == "parse":
+			msg = __load__(request)
+			if request.get("validate"):
+				msg.validate()
+			return {"ok": True, "ns": msg._ns, "tag": msg.tag(), "fingerprint": msg.fingerprint().hex()}
+
+		elif op == "validate":
+			if request.get("path") is not None:
+				try:
+					with open(request["path"], "rb") as f:
+						xml = f.read()
+				except OSError as e:
+					raise ParseError(str(e))
+			else:
+				xml = request.get("xml")
+				if xml is None:
+					raise ParseError("Request has no xml or path")
+			issues = validation.validate_xml(xml, request.get("engine", "python"))
+			return {"ok": not issues, "issues": [ list(issue) for issue in issues ]}
+
+		elif op == "convert":
+			msg = __load__(request)
+			if request.get("validate"):
+				msg.validate()
+			return {"ok": True, "ns": msg._ns, "xml": mutate.compact_xml(msg)}
+
+		else:
+			return __error__("RequestError", f"Unknown op {op}")
+
+	except Exception as e:
+		# One bad message mustn't take the worker down.
+		return __error__(type(e).__name__, str(e))
+
+#
+# Server side.
+#
+
+class _Done(object):
+
+	# Stands in for an AsyncResult when we already have the answer.
+
+	def __init__(self, value):
+		self.value = value
+
+	def get(self):
+		return self.value
+
+class Daemon(object):
+
+	"""
+	A pool of warm worker processes, plus the servers in front of it.
+	"""
+
+	def __init__(self, processes=None, preload=(), snapshot=None):
+
+		self.processes = processes or os.cpu_count() or 1
+		self._servers = []
+
+		if snapshot is not None:
+			import parsers
+			parsers.use_snapshot(snapshot)
+
+		# Load everything here, before forking, so that the workers share
+		# the class objects rather than each building their own.
+		__load_classes__(tuple(preload))
+
+		if "fork" in multiprocessing.get_all_start_methods():
+			context = multiprocessing.get_context("fork")
+			# (Forked workers already have the snapshot.)
+			snapshot = None
+		else:
+			context = multiprocessing.get_context()
+
+		self.pool = context.Pool(self.processes, initializer=__init_worker__, initargs=(tuple(preload), snapshot))
+
+	def submit(self, payload):
+
+		"""
+		Hand a decoded request (or list of requests) to the pool. Returns
+		something with a get() method that waits for the response.
+		"""
+
+		if type(payload) == list:
+			chunksize = max(1, len(payload) // (self.processes * 4))
+			return self.pool.map_async(__run_request__, payload, chunksize)
+
+		return self.pool.apply_async(__run_request__, (payload,))
+
+	def listen_unix(self, path):
+
+		# Clear up after a previous run, but don't delete anything else.
+		if os.path.exists(path):
+			if not stat.S_ISSOCK(os.stat(path).st_mode):
+				raise ValueError(f"{path} exists and is not a socket")
+			os.unlink(path)
+
+		# Owner-only from the moment it exists.
+		old_umask = os.umask(0o177)
+		try:
+			server = _UnixServer(path, _UnixHandler)
+		finally:
+			os.umask(old_umask)
+
+		server.dispatcher = self
+		self._servers.append(server)
+
+		return server
+
+	def listen_http(self, port, host="127.0.0.1", token=None):
+
+		"""
+		Every request has to carry the token (a random one, if none is
+		given), which is kept on the returned server as .token
+		"""
+
+		server = ThreadingHTTPServer((host, port), _HTTPHandler)
+		server.daemon_threads = True
+		server.dispatcher = self
+		server.token = token or secrets.token_urlsafe(32)
+		self._servers.append(server)
+
+		return server
+
+	def serve_forever(self):
+
+		threads = [ threading.Thread(target=server.serve_forever, daemon=True) for server in self._servers ]
+		for thread in threads:
+			thread.start()
+
+		try:
+			for thread in threads:
+				thread.join()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			self.close()
+
+	def close(self):
+
+		for server in self._servers:
+			server.shutdown()
+			server.server_close()
+			if isinstance(server, _UnixServer):
+				try:
+					os.unlink(server.server_address)
+				except OSError:
+					pass
+
+		self._servers = []
+
+		self.pool.terminate()
+		self.pool.join()
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+	daemon_threads = True
+
+class _UnixHandler(socketserver.StreamRequestHandler):
+
+	def handle(self):
+
+		pending = queue.Queue()
+		writer = threading.Thread(target=self._write_responses, args=(pending,), daemon=True)
+		writer.start()
+
+		try:
+			for line in self.rfile:
+
+				line = line.strip()
+				if not line:
+					continue
+
+				try:
+					payload = json.loads(line)
+				except ValueError as e:
+					pending.put(_Done(__error__("RequestError", f"Invalid JSON: {e}")))
+					continue
+
+				pending.put(self.server.dispatcher.submit(payload))
+
+		finally:
+			pending.put(None)
+			writer.join()
+
+	def _write_responses(self, pending):
+
+		# Responses go back in request order, as each one completes.
+		broken = False
+
+		while (result := pending.get()) is not None:
+			response = result.get()
+			if broken:
+				continue
+			try:
+				self.wfile.write(__dumps__(response) + b"\n")
+				self.wfile.flush()
+			except OSError:
+				# Client went away; keep draining so the reader can finish.
+				broken = True
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+
+	protocol_version = "HTTP/1.1"
+
+	# Headers and body are written separately; don't let Nagle hold the
+	# body back waiting for an ACK.
+	disable_nagle_algorithm = True
+
+	def do_POST(self):
+
+		# Check the token before reading anything else, so that nobody
+		# without it can make us read a body. (Compared in constant time,
+		# so it can't be guessed a character at a time.) The unread body
+		# would be taken as the next request, so hang up.
+		expected = f"Bearer {self.server.token}".encode()
+		if not hmac.compare_digest(self.headers.get("Authorization", "").encode(), expected):
+			self.close_connection = True
+			return self._respond(401, __error__("AuthError", "Missing or invalid token"))
+
+		try:
+			body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		except ValueError:
+			self.close_connection = True
+			return self._respond(400, __error__("RequestError", "Invalid Content-Length"))
+
+		op = self.path.strip("/")
+		if op not in OPS:
+			return self._respond(404, __error__("RequestError", f"Unknown op {op}"))
+
+		try:
+			payload = json.loads(body)
+		except ValueError as e:
+			return self._respond(400, __error__("RequestError", f"Invalid JSON: {e}"))
+
+		# The URL says what to do.
+		for request in (payload if type(payload) == list else (payload,)):
+			if type(request) == dict:
+				request["op"] = op
+
+		self._respond(200, self.server.dispatcher.submit(payload).get())
+
+	def _respond(self, status, response):
+
+		body = __dumps__(response)
+
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		if self.close_connection:
+			self.send_header("Connection", "close")
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+#
+# Client side.
+#
+
+class DaemonClient(object):
+
+	"""
+	Client for a running daemon. address is the socket path, or
+	http://127.0.0.1:<port> (which needs the daemon's token).
+
+	parse_file/parse_xml return a ParsedSummary rather than the message
+	itself (which stays in the daemon), and raise the same errors as the
+	library.
+	"""
+
+	def __init__(self, address, token=None):
+
+		self.address = address
+		self.token = token
+		self._lock = threading.Lock()
+		self._conn = None
+		self._file = None
+
+		if address.startswith("http://"):
+			url = urlsplit(address)
+			self._http = (url.hostname, url.port or 80)
+		else:
+			self._http = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+
+		with self._lock:
+			if self._file is not None:
+				self._file.close()
+			if self._conn is not None:
+				self._conn.close()
+			self._conn = None
+			self._file = None
+
+	def request(self, payload):
+
+		"""
+		Send one raw request (or a list of them), and return the decoded
+		response.
+		"""
+
+		# Nothing to send, and nothing to answer.
+		if type(payload) == list and not payload:
+			return []
+
+		with self._lock:
+			if self._http is not None:
+				return self._request_http(payload)
+			return self._request_unix(payload)
+
+	def stream(self, requests):
+
+		"""
+		Send many requests down one Unix socket connection without waiting
+		for each answer, yielding the responses in order.
+		"""
+
+		if self._http is not None:
+			for request in requests:
+				yield self.request(request)
+			return
+
+		requests = list(requests)
+
+		# A connection of its own, so other calls aren't held up meanwhile.
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		sock.connect(self.address)
+		with sock, sock.makefile("rb") as responses:
+			sender = threading.Thread(target=self._send_all, args=(sock, requests), daemon=True)
+			sender.start()
+			for _ in requests:
+				yield json.loads(responses.readline())
+			sender.join()
+
+	def _send_all(self, sock, requests):
+
+		with sock.makefile("wb") as f:
+			for request in requests:
+				f.write(__dumps__(request) + b"\n")
+		sock.shutdown(socket.SHUT_WR)
+
+	def _request_unix(self, payload):
+
+		if self._file is None:
+			self._conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self._conn.connect(self.address)
+			self._file = self._conn.makefile("rwb")
+
+		self._file.write(__dumps__(payload) + b"\n")
+		self._file.flush()
+
+		line = self._file.readline()
+		if not line:
+			self._file.close()
+			self._conn.close()
+			self._conn = self._file = None
+			raise ConnectionError("Daemon closed the connection")
+
+		return json.loads(line)
+
+	def _request_http(self, payload):
+
+		if self._conn is None:
+			self._conn = http.client.HTTPConnection(*self._http)
+
+		# Over HTTP, the URL says what to do, so a batch has to agree on it.
+		ops = { request.get("op", "") if type(request) == dict else "" for request in (payload if type(payload) == list else (payload,)) }
+		if len(ops) > 1:
+			raise ValueError(f"Requests in an HTTP batch must all have the same op, got {', '.join(sorted(ops))}")
+		op = ops.pop()
+
+		headers = {"Content-Type": "application/json"}
+		if self.token is not None:
+			headers["Authorization"] = f"Bearer {self.token}"
+
+		try:
+			self._conn.request("POST", f"/{op}", body=__dumps__(payload), headers=headers)
+			response = self._conn.getresponse()
+			body = response.read()
+		except (OSError, http.client.HTTPException):
+			self._conn.close()
+			self._conn = None
+			raise
+
+		if response.will_close:
+			self._conn.close()
+			self._conn = None
+
+		if response.status == 401:
+			raise PermissionError(json.loads(body)["message"])
+
+		return json.loads(body)
+
+	def parse_file(self, filepath, msgtype=None, validate=False):
+		return self._summary(self.request(__path_request__("parse", filepath, msgtype, validate)))
+
+	def parse_xml(self, xml, msgtype=None, validate=False):
+		return self._summary(self.request(__xml_request__("parse", xml, msgtype, validate)))
+
+	def parse_files(self, filepaths, msgtype=None, validate=False):
+
+		"""
+		As parsers.parse_files(): one batch, spread across the daemon's
+		workers. The first failure is raised.
+		"""
+
+		responses = self.request([ __path_request__("parse", filepath, msgtype, validate) for filepath in filepaths ])
+		return [ self._summary(response) for response in responses ]
+
+	def validate(self, filepath=None, xml=None, engine="python"):
+
+		"""
+		Returns True, or raises ValidateError for the first problem found,
+		like validate() on a message.
+		"""
+
+		issues = self.validate_xml(xml, engine) if filepath is None else self._issues(self.request({"op": "validate", "path": os.path.abspath(filepath), "engine": engine}))
+
+		if issues:
+			path, message = issues[0]
+			raise ValidateError(f"{path} : {message}" if path is not None else message)
+
+		return True
+
+	def validate_xml(self, xml, engine="python"):
+
+		"""
+		As validation.validate_xml(): a list of ValidationIssues.
+		"""
+
+		return self._issues(self.request({"op": "validate", "xml": __text__(xml), "engine": engine}))
+
+	def convert(self, filepath=None, xml=None, msgtype=None, validate=False):
+
+		"""
+		Parse, (optionally) validate, and write back out on one line with
+		mutate.compact_xml(), which parses back to the same message.
+		"""
+
+		if filepath is not None:
+			request = __path_request__("convert", filepath, msgtype, validate)
+		else:
+			request = __xml_request__("convert", xml, msgtype, validate)
+
+		response = self.request(request)
+		__raise_for__(response, ParseError)
+
+		return response["xml"]
+
+	def _summary(self, response):
+
+		__raise_for__(response, ParseError)
+		return ParsedSummary(response["ns"], response["tag"], bytes.fromhex(response["fingerprint"]))
+
+	def _issues(self, response):
+
+		if "issues" not in response:
+			__raise_for__(response, ValidateError)
+
+		return [ ValidationIssue(*issue) for issue in response["issues"] ]
+
+def __text__(xml):
+	return xml.decode("utf-8") if type(xml) == bytes else xml
+
+def __path_request__(op, filepath, msgtype, validate):
+	# The daemon may not share our working directory.
+	return {"op": op, "path": os.path.abspath(filepath), "msgtype": msgtype, "validate": validate}
+
+def __xml_request__(op, xml, msgtype, validate):
+	return {"op": op, "xml": __text__(xml), "msgtype": msgtype, "validate": validate}
+
+def __raise_for__(response, default):
+
+	if not response.get("ok") and "error" in response:
+		raise _ERRORS.get(response["error"], default)(response["message"])
+
+if __name__ == "__main__":
+
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Serve ISO20022 parse/validate/convert requests from a warm worker pool.")
+	parser.add_argument("--socket", help="Unix socket path to listen on")
+	parser.add_argument("--http", type=int, help="Localhost port to listen on")
+	parser.add_argument("--token-file", help="File holding the token HTTP clients must send (created if it doesn't exist)")
+	parser.add_argument("-p", "--processes", type=int, default=None)
+	parser.add_argument("--preload", default="", help="Comma-separated message types to load up front, e.g. pain.001.001.09")
+	parser.add_argument("--snapshot", default=None, help="Schema snapshot to load classes from (see snapshot.py)")
+	args = parser.parse_args()
+
+	if args.socket is None and args.http is None:
+		parser.error("Give --socket, --http, or both")
+	if args.http is not None and args.token_file is None:
+		parser.error("--http needs --token-file")
+
+	daemon = Daemon(args.processes, [ msgtype for msgtype in args.preload.split(",") if msgtype ], args.snapshot)
+
+	if args.socket is not None:
+		daemon.listen_unix(args.socket)
+		print(f"Listening on {args.socket}")
+	if args.http is not None:
+		daemon.listen_http(args.http, token=load_token(args.token_file))
+		print(f"Listening on http://127.0.0.1:{args.http} (token in {args.token_file})")
+
+	daemon.serve_forever()
@@ -0,0 +1,328 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import os
+import math
+import mmap
+import time
+import struct
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from exceptions import ParseError
+from base_types import _BaseElemType, _BaseFieldType
+import xml_backends
+
+Reference = namedtuple("Reference", ["kind", "value"])
+
+# GrpHdr/MsgId, plus EndToEndId and UETR wherever they appear.
+REFERENCE_KINDS = ("MsgId", "EndToEndId", "UETR")
+
+def extract_references(source):
+
+	"""
+	Pull out the references we check for duplicates. Works on a parsed
+	message, or on a raw ElementTree/Element (which is much cheaper, as
+	the message classes are never built).
+	"""
+
+	if isinstance(source, _BaseElemType):
+		refs = []
+		__walk_parsed__(source, None, refs)
+		return refs
+
+	node = source.getroot() if hasattr(source, "getroot") else source
+
+	refs = []
+	for n in node.iter():
+		tagname = __local_name__(n.tag)
+		if tagname == "GrpHdr":
+			for child in n:
+				if __local_name__(child.tag) == "MsgId" and child.text:
+					refs.append(Reference("MsgId", child.text.strip()))
+		elif tagname in ("EndToEndId", "UETR") and n.text:
+			refs.append(Reference(tagname, n.text.strip()))
+
+	return refs
+
+def extract_references_file(filepath):
+
+	"""
+	As extract_references(), but streams the file so that the full tree
+	is never held in memory.
+	"""
+
+	refs = []
+	stack = []
+
+	try:
+		for event, n in xml_backends.get_backend().iterparse(filepath, events=("start", "end")):
+
+			if event == "start":
+				stack.append(__local_name__(n.tag))
+				continue
+
+			tagname = stack.pop()
+			if n.text:
+				if tagname == "MsgId" and stack and stack[-1] == "GrpHdr":
+					refs.append(Reference("MsgId", n.text.strip()))
+				elif tagname in ("EndToEndId", "UETR"):
+					refs.append(Reference(tagname, n.text.strip()))
+
+			# We're done with this subtree.
+			n.clear()
+
+	except Exception as e:
+		raise ParseError(str(e))
+
+	return refs
+
+def __local_name__(tag):
+	return tag.rsplit("}", 1)[-1] if type(tag) == str else None
+
+def __walk_parsed__(elem, parent_tag, refs):
+
+	if not isinstance(elem, _BaseFieldType):
+		tagname = elem.tag()
+		data = elem.get()
+		if data is not None:
+			if tagname == "MsgId" and parent_tag == "GrpHdr":
+				refs.append(Reference("MsgId", data.strip()))
+			elif tagname in ("EndToEndId", "UETR"):
+				refs.append(Reference(tagname, data.strip()))
+		return
+
+	for field_def in elem._field_defs:
+		field = getattr(elem, field_def.name, None)
+		if field is None:
+			continue
+		for f in (field if field_def.array else (field,)):
+			__walk_parsed__(f, elem.tag(), refs)
+
+class _BaseDuplicateIndex(object):
+
+	def __init__(self, window=None):
+
+		self.window = window
+		self._lock = threading.Lock()
+
+	def seen(self, kind, value, now=None):
+
+		"""
+		Record a reference. Returns True if it has been seen before
+		(within the time window, if there is one).
+		"""
+
+		now = time.time() if now is None else now
+		key = f"{kind}\x00{value}".encode()
+
+		with self._lock:
+			return self._seen(key, now)
+
+	def check(self, source, now=None):
+
+		"""
+		Record every reference in a message (parsed, ElementTree, or a
+		path to a file), and return the ones that are duplicates.
+		"""
+
+		if type(source) == str or isinstance(source, os.PathLike):
+			refs = extract_references_file(source)
+		else:
+			refs = extract_references(source)
+
+		return [ ref for ref in refs if self.seen(ref.kind, ref.value, now) ]
+
+	def _seen(self, key, now):
+
+		raise NotImplementedError("Base class cannot track references.")
+
+class DuplicateIndex(_BaseDuplicateIndex):
+
+	"""
+	Exact in-memory index. If window (in seconds) is given, references
+	older than that are forgotten.
+	"""
+
+	def __init__(self, window=None):
+
+		super().__init__(window)
+		self._entries = OrderedDict()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def _seen(self, key, now):
+
+		self._evict(now)
+
+		if key in self._entries:
+			return True
+
+		self._entries[key] = now
+		return False
+
+	def _evict(self, now):
+
+		if self.window is None:
+			return
+
+		# Entries are kept in insertion order, so the oldest are first.
+		cutoff = now - self.window
+		while self._entries:
+			key, timestamp = next(iter(self._entries.items()))
+			if timestamp >= cutoff:
+				break
+			del self._entries[key]
+
+	def save(self, path):
+
+		with self._lock, open(path, "wb") as f:
+			for key, timestamp in self._entries.items():
+				f.write(struct.pack("<dI", timestamp, len(key)))
+				f.write(key)
+
+	def load(self, path):
+
+		"""
+		Add the references saved in path. Where a reference is in both,
+		the earlier time is kept.
+		"""
+
+		with self._lock, open(path, "rb") as f:
+			entries = self._entries
+			while header := f.read(12):
+				timestamp, length = struct.unpack("<dI", header)
+				key = f.read(length)
+				if key not in entries or timestamp < entries[key]:
+					entries[key] = timestamp
+
+			# Back into time order, which eviction relies on.
+			self._entries = OrderedDict(sorted(entries.items(), key=lambda entry: entry[1]))
+
+class BloomDuplicateIndex(_BaseDuplicateIndex):
+
+	"""
+	Fixed-size Bloom filter index, sized for capacity references at the
+	given false-positive rate. False positives are possible; misses are not.
+
+	If window (in seconds) is given, two filters are kept and the older one
+	is cleared every window, so references are forgotten after between one
+	and two windows.
+
+	If path is given, the filter lives in a memory-mapped file and
+	survives restarts.
+
+	The first window starts at now (default: the current time), unless
+	the filter is loaded from a file.
+	"""
+
+	_magic = b"ISOBLOOM"
+	_header = struct.Struct("<8sQQBBdd")
+
+	def __init__(self, capacity, fp_rate=0.001, window=None, path=None, now=None):
+
+		super().__init__(window)
+
+		now = time.time() if now is None else now
+
+		if capacity <= 0 or not 0 < fp_rate < 1:
+			raise ValueError("Invalid capacity or false-positive rate")
+
+		self.nbits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+		self.nhashes = max(1, round(self.nbits / capacity * math.log(2)))
+		self.generations = 1 if window is None else 2
+
+		self._nbytes = (self.nbits + 7) // 8
+		size = self._header.size + self.generations * self._nbytes
+
+		self._file = None
+		if path is None:
+			self._buf = bytearray(size)
+			self._write_header(0, now, now)
+		else:
+			exists = os.path.exists(path) and os.path.getsize(path) > 0
+			self._file = open(path, "r+b" if exists else "w+b")
+			if not exists:
+				self._file.truncate(size)
+			elif os.path.getsize(path) != size:
+				raise ValueError(f"{path} : Bloom filter file has different parameters")
+			self._buf = mmap.mmap(self._file.fileno(), size)
+			if exists:
+				self._read_header()
+			else:
+				self._write_header(0, now, now)
+
+	def _read_header(self):
+
+		magic, nbits, _, nhashes, generations, start0, start1 = self._header.unpack_from(self._buf, 0)
+
+		if magic != self._magic or (nbits, nhashes, generations) != (self.nbits, self.nhashes, self.generations):
+			raise ValueError("Bloom filter file has different parameters")
+
+	def _write_header(self, current, start0, start1):
+
+		self._header.pack_into(self._buf, 0, self._magic, self.nbits, current, self.nhashes, self.generations, start0, start1)
+
+	def _bit_indices(self, key):
+
+		digest = hashlib.blake2b(key, digest_size=16).digest()
+		h1 = int.from_bytes(digest[:8], "little")
+		h2 = int.from_bytes(digest[8:], "little") | 1
+
+		return [ (h1 + i * h2) % self.nbits for i in range(self.nhashes) ]
+
+	def _rotate(self, now):
+
+		_, _, current, _, _, start0, start1 = self._header.unpack_from(self._buf, 0)
+		starts = [start0, start1]
+
+		if self.window is None or now - starts[current] < self.window:
+			return current
+
+		# After two windows or more of quiet, everything in both filters is
+		# too old to keep.
+		if now - starts[current] >= 2 * self.window:
+			self._buf[self._header.size:] = bytes(self.generations * self._nbytes)
+
+		# Clear the older filter and start writing to it.
+		current = 1 - current
+		offset = self._header.size + current * self._nbytes
+		self._buf[offset:offset + self._nbytes] = bytes(self._nbytes)
+		starts[current] = now
+		self._write_header(current, *starts)
+
+		return current
+
+	def _seen(self, key, now):
+
+		current = self._rotate(now)
+		indices = self._bit_indices(key)
+
+		found = False
+		for g in range(self.generations):
+			offset = self._header.size + g * self._nbytes
+			if all(self._buf[offset + (i >> 3)] & (1 << (i & 7)) for i in indices):
+				found = True
+				break
+
+		if not found:
+			offset = self._header.size + current * self._nbytes
+			for i in indices:
+				self._buf[offset + (i >> 3)] |= 1 << (i & 7)
+
+		return found
+
+	def flush(self):
+
+		if self._file is not None:
+			self._buf.flush()
+
+	def close(self):
+
+		if self._file is not None:
+			self._buf.flush()
+			self._buf.close()
+			self._file.close()
+			self._file = None
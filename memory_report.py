@@ -0,0 +1,132 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import sys
+
+from base_types import _BaseElemType
+
+class MemoryReport(object):
+
+	"""
+	Deep memory footprint of one or more parsed messages.
+
+	by_class maps class name -> [bytes, objects] for the elements of that
+	class (their own size only). by_path maps field path, e.g.
+	Document.BkToCstmrStmt.Stmt.Ntry -> [bytes, objects] for everything
+	at or below that path (so Document is the whole message).
+
+	Sizes are sys.getsizeof() of the element objects, their __dict__s,
+	attribute dicts, lists and data values. Objects shared between
+	elements (e.g. interned strings) are counted once per message.
+	"""
+
+	def __init__(self):
+
+		self.total_bytes = 0
+		self.total_objects = 0
+		self.messages = 0
+		self.max_message_bytes = 0
+
+		self.by_class = {}
+		self.by_path = {}
+
+	def add(self, msg):
+
+		seen = set()
+		message_bytes = 0
+
+		# (element, path, paths of this element and its ancestors)
+		stack = [(msg, msg._whoami(), (msg._whoami(),))]
+
+		while stack:
+
+			elem, path, chain = stack.pop()
+
+			size = 0
+			objects = 0
+
+			for obj in (elem, elem.__dict__):
+				size += sys.getsizeof(obj)
+				objects += 1
+
+			for name, value in elem.__dict__.items():
+
+				# (Points back up the tree.)
+				if name == "_parent":
+					continue
+
+				if isinstance(value, _BaseElemType):
+					child_path = f"{path}.{value._tag}"
+					stack.append((value, child_path, chain + (child_path,)))
+					continue
+
+				if id(value) in seen or value is None:
+					continue
+				seen.add(id(value))
+
+				size += sys.getsizeof(value)
+				objects += 1
+
+				if type(value) == list:
+					for f in value:
+						if isinstance(f, _BaseElemType):
+							child_path = f"{path}.{f._tag}"
+							stack.append((f, child_path, chain + (child_path,)))
+				elif name == "attrib":
+					for attrib_name, attrib in value.items():
+						if isinstance(attrib, _BaseElemType):
+							child_path = f"{path}[{attrib_name}]"
+							stack.append((attrib, child_path, chain + (child_path,)))
+
+			class_entry = self.by_class.setdefault(type(elem).__name__, [0, 0])
+			class_entry[0] += size
+			class_entry[1] += objects
+
+			for p in chain:
+				path_entry = self.by_path.setdefault(p, [0, 0])
+				path_entry[0] += size
+				path_entry[1] += objects
+
+			message_bytes += size
+			self.total_objects += objects
+
+		self.total_bytes += message_bytes
+		self.messages += 1
+		self.max_message_bytes = max(self.max_message_bytes, message_bytes)
+
+		return self
+
+	def format(self, top=20):
+
+		lines = [
+			f"{self.messages} message(s), {self.total_bytes:,} bytes in {self.total_objects:,} objects"
+			f" (mean {self.total_bytes // max(self.messages, 1):,} bytes, max {self.max_message_bytes:,} bytes per message)",
+			"",
+			"By class:",
+		]
+
+		for name, (size, objects) in sorted(self.by_class.items(), key=lambda x: -x[1][0])[:top]:
+			lines.append(f"  {size:>14,}  {objects:>10,}  {name}")
+
+		lines += ["", "By path (including everything below):"]
+
+		for path, (size, objects) in sorted(self.by_path.items(), key=lambda x: -x[1][0])[:top]:
+			lines.append(f"  {size:>14,}  {objects:>10,}  {path}")
+
+		return "\n".join(lines)
+
+	def __str__(self):
+		return self.format()
+
+def memory_report_batch(msgs):
+
+	"""
+	Aggregate a MemoryReport across a sample of messages.
+	"""
+
+	report = MemoryReport()
+
+	for msg in msgs:
+		report.add(msg)
+
+	return report
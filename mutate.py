@@ -0,0 +1,476 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+"""
+Schema-aware mutation fuzzing.
+
+Takes parsed seed messages and produces "almost valid" mutants, each
+breaking exactly one rule from the schema metadata (so each fails
+validation with exactly one issue):
+
+ - bounds:     a field occurs fewer/more times than its FieldEntry allows
+ - mutex:      a second member of a mutex group is filled in
+ - enum:       a near-miss of one of the allowed enum values
+ - max_length: one character longer than _max
+ - pattern:    a value corrupted so it no longer matches _pattern
+ - digits:     one digit more than totalDigits/fractionDigits allow
+
+A mutated value only counts if it passes once the rule it targets is
+lifted, so it doesn't also break a length, pattern or bound.
+
+Mutations are applied in place, serialised with compact_xml(), and
+then undone, so no copying is needed between mutants. Choices are
+driven by a seeded RNG; the only non-deterministic part is the content
+generated to fill in a mutex group (see gen_utils).
+"""
+
+import os
+import re
+import random
+from collections import namedtuple
+from multiprocessing import Pool
+from xml.sax.saxutils import escape, quoteattr
+
+from exceptions import GenerateError
+from base_types import _BaseElemType, _BaseFieldType, _BaseDataType, _BaseDataType_String, _BaseDataType_B64Binary, _BaseDataType_Decimal
+from base_types import _BaseDataType_Date, _BaseDataType_Time, _BaseDataType_gYear, _BaseDataType_gYearMonth, _BaseDataType_gMonth, _BaseDataType_DateTime
+
+Mutant = namedtuple("Mutant", ["kind", "path", "xml"])
+
+MUTATIONS = ("bounds", "mutex", "enum", "max_length", "pattern", "digits")
+
+# Characters tried when corrupting a pattern.
+_CORRUPT_CHARS = " !#%&*+-./:;=?@Z_az~09"
+
+# Attempts at finding a value that breaks only the rule we're after.
+_ATTEMPTS = 32
+
+# (Roughly) what XSD accepts for the date and time types, which is more
+# than our patterns do: longer and negative years, and timezones on
+# dates. Corrupted values in here wouldn't be rejected by an XSD.
+_XSD_TZ = r"(Z|[+-][0-9]{2}:[0-9]{2})?"
+_XSD_DATE = r"-?[0-9]{4,}-[0-9]{2}-[0-9]{2}"
+_XSD_TIME = r"[0-9]{2}:[0-9]{2}:[0-9]{2}(\.[0-9]+)?"
+_XSD_LEXICAL = {
+	_BaseDataType_DateTime: re.compile(f"{_XSD_DATE}T{_XSD_TIME}{_XSD_TZ}").fullmatch,
+	_BaseDataType_Time: re.compile(f"{_XSD_TIME}{_XSD_TZ}").fullmatch,
+	_BaseDataType_gYear: re.compile(f"-?[0-9]{{4,}}{_XSD_TZ}").fullmatch,
+	_BaseDataType_gYearMonth: re.compile(f"-?[0-9]{{4,}}-[0-9]{{2}}{_XSD_TZ}").fullmatch,
+	_BaseDataType_gMonth: re.compile(f"(--)?[0-9]{{2}}{_XSD_TZ}").fullmatch,
+	_BaseDataType_Date: re.compile(f"{_XSD_DATE}{_XSD_TZ}").fullmatch,
+}
+
+# Don't grow lists past this many extra entries to break an upper bound.
+_MAX_GROWTH = 1000
+
+class Mutator(object):
+
+	def __init__(self, seeds, seed=None, kinds=MUTATIONS):
+
+		self.rng = random.Random(seed)
+		self._seeds = list(seeds)
+
+		# kind -> [(seed index, site)]
+		self._sites = { kind: [] for kind in kinds }
+
+		for i, msg in enumerate(self._seeds):
+			for kind, site in self._find_sites(msg):
+				if kind in self._sites:
+					self._sites[kind].append((i, site))
+
+		self._kinds = [ kind for kind in kinds if self._sites[kind] ]
+		if not self._kinds:
+			raise GenerateError("No mutation sites in seed messages")
+
+		self._mutex_fillers = {}
+		self._patterns = {}
+		self._relaxed = {}
+
+	def mutants(self, count):
+
+		"""
+		Yields count Mutants.
+		"""
+
+		produced = 0
+		failures = 0
+		while produced < count:
+			mutant = self.mutate()
+			if mutant is not None:
+				produced += 1
+				failures = 0
+				yield mutant
+			else:
+				failures += 1
+				if failures > 1000:
+					raise GenerateError("Could not mutate seed messages")
+
+	def mutate(self):
+
+		"""
+		Produce one Mutant (or None, if the chosen site turned out not to
+		be mutable).
+		"""
+
+		kind = self.rng.choice(self._kinds)
+		seed_index, site = self.rng.choice(self._sites[kind])
+
+		result = getattr(self, f"_mutate_{kind}")(*site[1:])
+		if result is None:
+			return None
+
+		undo = result
+		try:
+			xml = compact_xml(self._seeds[seed_index])
+		finally:
+			undo()
+
+		return Mutant(kind, site[0], xml)
+
+	def _find_sites(self, msg):
+
+		stack = [(msg, msg._whoami())]
+
+		while stack:
+
+			elem, path = stack.pop()
+
+			if not isinstance(elem, _BaseFieldType):
+				for kind in self._leaf_kinds(elem):
+					yield kind, (path, elem)
+				continue
+
+			if elem._attrib_defs is not None:
+				for attrib_name, attrib in elem.attrib.items():
+					if isinstance(attrib, _BaseDataType):
+						for kind in self._leaf_kinds(attrib):
+							yield kind, (f"{path}[{attrib_name}]", attrib)
+
+			mutex_groups = set()
+
+			for field_def in elem._field_defs:
+
+				field = getattr(elem, field_def.name, None)
+				field_path = f"{path}.{field_def.name}"
+
+				if field is not None and field_def.mutex_group is not None and field_def.mutex_group not in mutex_groups:
+					mutex_groups.add(field_def.mutex_group)
+					if sum(1 for fd in elem._field_defs if fd.mutex_group == field_def.mutex_group) > 1:
+						yield "mutex", (path, elem, field_def.mutex_group)
+
+				if field is None:
+					continue
+
+				if field_def.array:
+					if len(field) > 0 and (field_def.min or field_def.max is not None):
+						yield "bounds", (field_path, elem, field_def)
+					children = field
+				else:
+					if field_def.min:
+						yield "bounds", (field_path, elem, field_def)
+					children = (field,)
+
+				stack.extend( (f, field_path) for f in reversed(children) if isinstance(f, _BaseElemType) )
+
+	def _leaf_kinds(self, leaf):
+
+		if isinstance(leaf, _BaseDataType_String) and leaf._values:
+			yield "enum"
+		if isinstance(leaf, (_BaseDataType_String, _BaseDataType_B64Binary)) and leaf._max is not None:
+			yield "max_length"
+		if getattr(leaf, "_pattern", None) is not None and type(leaf.data) == str:
+			yield "pattern"
+		if isinstance(leaf, _BaseDataType_Decimal) and (leaf._max_totaldigits is not None or leaf._max_fractiondigits is not None):
+			yield "digits"
+
+	def _breaks_only(self, leaf, facet, data):
+
+		# True if data fails the leaf's class, but passes once facet is
+		# lifted (i.e. it breaks that rule and no other).
+		leaf_class = type(leaf)
+
+		relaxed = self._relaxed.get((leaf_class, facet))
+		if relaxed is None:
+			relaxed = self._relaxed[(leaf_class, facet)] = type(leaf_class.__name__, (leaf_class,), {facet: None})
+
+		probe = relaxed(leaf.tag(), data)
+
+		if not leaf_class._do_batch_validation([probe]):
+			return False
+
+		# Dates and times have no other rules to check against, but need
+		# to be out of XSD's reach as well as ours.
+		if not isinstance(leaf, (_BaseDataType_String, _BaseDataType_B64Binary, _BaseDataType_Decimal)):
+			xsd_lexical = next((_XSD_LEXICAL[c] for c in leaf_class.__mro__ if c in _XSD_LEXICAL), None)
+			return type(data) != str or xsd_lexical is None or not xsd_lexical(data)
+
+		return not relaxed._do_batch_validation([probe])
+
+	def _set_data(self, leaf, data):
+
+		old = leaf.data
+		leaf.set(data)
+
+		def undo():
+			leaf.set(old)
+
+		return undo
+
+	def _set_field(self, elem, name, value):
+
+		old = getattr(elem, name)
+		setattr(elem, name, value)
+
+		def undo():
+			setattr(elem, name, old)
+
+		return undo
+
+	def _mutate_bounds(self, elem, field_def):
+
+		field = getattr(elem, field_def.name)
+
+		if not field_def.array:
+			return self._set_field(elem, field_def.name, None)
+
+		options = []
+		if field_def.min:
+			options.append(field[:field_def.min-1])
+		if field_def.max is not None and field_def.max + 1 - len(field) <= _MAX_GROWTH:
+			options.append(field + [ self.rng.choice(field) for _ in range(field_def.max + 1 - len(field)) ])
+
+		if not options:
+			return None
+
+		return self._set_field(elem, field_def.name, self.rng.choice(options))
+
+	def _mutate_mutex(self, elem, mutex_group):
+
+		empty = [ fd for fd in elem._field_defs if fd.mutex_group == mutex_group and getattr(elem, fd.name, None) is None ]
+		if not empty:
+			return None
+
+		field_def = self.rng.choice(empty)
+
+		# Generated once per site, then reused.
+		key = (id(elem), field_def.name)
+		if key not in self._mutex_fillers:
+			try:
+				filler = field_def.type(field_def.name)
+				filler.generate()
+			except (GenerateError, NotImplementedError):
+				filler = None
+			self._mutex_fillers[key] = filler
+
+		filler = self._mutex_fillers[key]
+		if filler is None:
+			return None
+
+		return self._set_field(elem, field_def.name, [filler] if field_def.array else filler)
+
+	def _mutate_enum(self, leaf):
+
+		values = sorted(leaf._values)
+		value = self.rng.choice(values)
+
+		candidates = [
+			value.swapcase(),
+			value[:-1],
+			value + self.rng.choice(value or "X"),
+		]
+		if value:
+			i = self.rng.randrange(len(value))
+			candidates.append(value[:i] + chr(ord(value[i]) + 1) + value[i+1:])
+
+		candidates = [ c for c in candidates if c and self._breaks_only(leaf, "_values", c) ]
+		if not candidates:
+			return None
+
+		return self._set_data(leaf, self.rng.choice(candidates))
+
+	def _mutate_max_length(self, leaf):
+
+		data = leaf.data if type(leaf.data) == str else ""
+
+		# Pad with characters already in the value, so that it still
+		# matches any pattern.
+		pads = sorted(set(data)) + ["X", "0"]
+		self.rng.shuffle(pads)
+
+		for pad in pads:
+			candidate = (data + pad * (leaf._max + 1))[:leaf._max + 1]
+			if self._breaks_only(leaf, "_max", candidate):
+				return self._set_data(leaf, candidate)
+
+		return None
+
+	def _mutate_pattern(self, leaf):
+
+		fullmatch = self._patterns.get(leaf._pattern)
+		if fullmatch is None:
+			fullmatch = self._patterns[leaf._pattern] = re.compile(leaf._pattern).fullmatch
+
+		data = leaf.data
+
+		for _ in range(_ATTEMPTS):
+			i = self.rng.randrange(len(data) + 1)
+			c = self.rng.choice(_CORRUPT_CHARS)
+			candidate = data[:i] + c + data[i+1:] if self.rng.random() < 0.5 else data[:i] + c + data[i:]
+
+			# XSD strips the whitespace around anything but a string.
+			if not isinstance(leaf, _BaseDataType_String) and candidate != candidate.strip():
+				continue
+
+			if not fullmatch(candidate) and self._breaks_only(leaf, "_pattern", candidate):
+				return self._set_data(leaf, candidate)
+
+		return None
+
+	def _mutate_digits(self, leaf):
+
+		td = leaf._max_totaldigits
+		fd = leaf._max_fractiondigits
+
+		# (facet, integer digits, fraction digits) of values that have one
+		# digit too many.
+		layouts = []
+		if td is not None:
+			layouts += [ ("_max_totaldigits", td + 1 - f, f) for f in range(0, min(td, fd if fd is not None else td) + 1) ]
+		if fd is not None:
+			layouts += [ ("_max_fractiondigits", i, fd + 1) for i in range(0, (td - fd if td is not None else 1) + 1) ]
+
+		for _ in range(_ATTEMPTS):
+			facet, int_digits, frac_digits = self.rng.choice(layouts)
+			candidate = self._random_decimal(int_digits, frac_digits)
+			if self._breaks_only(leaf, facet, candidate):
+				return self._set_data(leaf, candidate)
+
+		return None
+
+	def _random_decimal(self, int_digits, frac_digits):
+
+		# No leading or trailing zeros, so the digits count the same way
+		# here as in XSD.
+		digits = lambda n: "".join(self.rng.choice("0123456789") for _ in range(n))
+
+		int_part = self.rng.choice("123456789") + digits(int_digits - 1) if int_digits > 0 else "0"
+		frac_part = digits(frac_digits - 1) + self.rng.choice("123456789") if frac_digits > 0 else ""
+
+		sign = self.rng.choice(("", "-"))
+		return f"{sign}{int_part}.{frac_part}" if frac_part else f"{sign}{int_part}"
+
+def compact_xml(msg):
+
+	"""
+	Serialise a message on one line, with the namespace on the root.
+	Unlike to_xml(), leaf text is written inline and escaped, so it
+	parses back to exactly the same values.
+	"""
+
+	out = []
+	__write_xml__(msg, out, msg._ns)
+	return "".join(out)
+
+def __write_xml__(elem, out, ns=None):
+
+	tag = elem.tag()
+	out.append(f"<{tag}")
+
+	if ns is not None:
+		out.append(f" xmlns={quoteattr(ns)}")
+
+	if elem._attrib_defs is not None:
+		for name, attrib in elem.attrib.items():
+			if attrib is not None and attrib.data is not None:
+				out.append(f" {name}={quoteattr(__text__(attrib.data))}")
+
+	if isinstance(elem, _BaseFieldType):
+		out.append(">")
+		for field_def in elem._field_defs:
+			field = getattr(elem, field_def.name, None)
+			if field is None:
+				continue
+			for f in (field if type(field) == list else (field,)):
+				__write_xml__(f, out)
+		out.append(f"</{tag}>")
+	elif elem.data is None:
+		out.append("/>")
+	else:
+		out.append(f">{escape(__text__(elem.data))}</{tag}>")
+
+def __text__(data):
+	return data.decode() if type(data) == bytes else str(data)
+
+# Per-worker state for fuzz_to_dir.
+_worker_mutator = None
+
+def __init_worker__(seed_paths, kinds, snapshot):
+
+	import parsers
+
+	if snapshot is not None:
+		parsers.use_snapshot(snapshot)
+
+	global _worker_mutator
+	_worker_mutator = Mutator([ parsers.parse_file(p) for p in seed_paths ], kinds=kinds)
+
+def __run_chunk__(args):
+
+	out_dir, seed, chunk, count = args
+
+	# Reseed per chunk, so output doesn't depend on which worker got it.
+	_worker_mutator.rng.seed(seed * 1000003 + chunk)
+
+	counts = {}
+	for i, mutant in enumerate(_worker_mutator.mutants(count)):
+		with open(os.path.join(out_dir, f"mutant-{chunk:06d}-{i:05d}-{mutant.kind}.xml"), "w") as f:
+			f.write(mutant.xml)
+		counts[mutant.kind] = counts.get(mutant.kind, 0) + 1
+
+	return counts
+
+def fuzz_to_dir(seed_paths, out_dir, count, seed=0, processes=None, kinds=MUTATIONS, chunk_size=1000, snapshot=None):
+
+	"""
+	Write count mutants of the seed files to out_dir, across a pool of
+	worker processes. Returns the number of mutants of each kind.
+	If snapshot is given, workers load classes from it (see snapshot.py).
+	"""
+
+	os.makedirs(out_dir, exist_ok=True)
+
+	chunks = [
+		(out_dir, seed, chunk, min(chunk_size, count - start))
+		for chunk, start in enumerate(range(0, count, chunk_size))
+	]
+
+	totals = {}
+
+	with Pool(processes, initializer=__init_worker__, initargs=(list(seed_paths), kinds, snapshot)) as pool:
+		for counts in pool.imap_unordered(__run_chunk__, chunks):
+			for kind, n in counts.items():
+				totals[kind] = totals.get(kind, 0) + n
+
+	return totals
+
+if __name__ == "__main__":
+
+	import argparse
+	import time
+
+	parser = argparse.ArgumentParser(description="Write schema-aware mutants of ISO20022 messages.")
+	parser.add_argument("seeds", nargs="+", help="Seed message files")
+	parser.add_argument("-o", "--out", required=True, help="Output directory")
+	parser.add_argument("-n", "--count", type=int, default=10000)
+	parser.add_argument("-s", "--seed", type=int, default=0)
+	parser.add_argument("-p", "--processes", type=int, default=None)
+	parser.add_argument("-k", "--kinds", default=",".join(MUTATIONS), help="Comma-separated mutation kinds")
+	parser.add_argument("--snapshot", default=None, help="Schema snapshot to load classes from (see snapshot.py)")
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	totals = fuzz_to_dir(args.seeds, args.out, args.count, args.seed, args.processes, tuple(args.kinds.split(",")), snapshot=args.snapshot)
+	elapsed = time.perf_counter() - start
+
+	print(", ".join(f"{kind}: {n}" for kind, n in sorted(totals.items())))
+	print(f"{args.count} mutants in {elapsed:.2f}s ({args.count / elapsed:,.0f}/s)")
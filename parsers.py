@@ -1,34 +1,166 @@
 # GPLv3.0 License.
 # See LICENSE.md file in the project root for full license information.
 
+import os
 import re
-import defusedxml.ElementTree as ET
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from collections import namedtuple as __namedtuple__
 
-import iso20022
+from exceptions import ParseError
+import xml_backends
 
 __node_info__ = __namedtuple__("__node_info__", ["ns", "msgtype", "tagname", "msgtype_normalised", "data"])
 
 # Note that we need to protect the user from etree vulns!
 
+# All of the parse, validate, to_xml and generate paths keep their state
+# on the message objects themselves, so separate messages can be handled
+# from separate threads. (Don't share one message between threads while
+# editing it, though.)
+
+# Where message classes are looked up: the iso20022 package, or a schema
+# snapshot (see use_snapshot()). Set on first use.
+_message_classes = None
+_schema_version = None
+
+def use_snapshot(path):
+
+	"""
+	Look message classes up in a schema snapshot (see snapshot.py) rather
+	than importing the iso20022 package, which is much faster to start.
+	Pass None to go back to the package.
+
+	The ISO20022_SNAPSHOT environment variable does the same for scripts
+	that don't call this.
+	"""
+
+	global _message_classes, _schema_version
+
+	if path is None:
+		import iso20022
+		_message_classes = iso20022
+	else:
+		import snapshot
+		_message_classes = snapshot.SchemaSnapshot(path)
+
+	_schema_version = None
+
+def message_classes():
+
+	"""
+	The iso20022 package, or the snapshot standing in for it.
+	"""
+
+	if _message_classes is None:
+		use_snapshot(os.environ.get("ISO20022_SNAPSHOT") or None)
+
+	return _message_classes
+
+def schema_version():
+
+	"""
+	Identifies the message classes in use, e.g. for keying caches of
+	parsed messages. A hash of base_types.py plus the classes' own
+	__version__ if they set one, or else their sources (the package's
+	.py files, or the snapshot).
+	"""
+
+	global _schema_version
+
+	if _schema_version is None:
+		_schema_version = __schema_version__(message_classes())
+
+	return _schema_version
+
+def __schema_version__(classes):
+
+	import base_types
+
+	h = hashlib.sha256()
+	with open(base_types.__file__, "rb") as f:
+		h.update(f.read())
+
+	version = getattr(classes, "__version__", None)
+	digest = getattr(classes, "digest", None)
+
+	if version:
+		h.update(f"version:{version}".encode())
+	elif digest:
+		h.update(f"snapshot:{digest}".encode())
+	else:
+		paths = []
+		for directory in getattr(classes, "__path__", ()):
+			for dirpath, dirnames, filenames in os.walk(directory):
+				dirnames.sort()
+				paths.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name.endswith(".py"))
+		if not paths:
+			paths.append(classes.__file__)
+		for path in paths:
+			with open(path, "rb") as f:
+				h.update(f.read())
+
+	return h.hexdigest()
+
 def parse_file(filepath, msgtype=None):
 
 	try:
-		tree = ET.parse(filepath)
+		tree = xml_backends.get_backend().parse(filepath)
 	except Exception as e:
-		raise iso20022.ParseError(str(e))
+		raise ParseError(str(e))
 
 	return parse_etree(tree, msgtype)
 
 def parse_xml(xml, msgtype=None):
 
 	try:
-		tree = ET.ElementTree(ET.fromstring(xml))
+		tree = xml_backends.get_backend().parse_string(xml)
 	except Exception as e:
-		raise iso20022.ParseError(str(e))
+		raise ParseError(str(e))
 
 	return parse_etree(tree, msgtype)
 
+def parse_files(filepaths, msgtype=None, validate=False, max_workers=None):
+
+	"""
+	Parse (and optionally validate) many files on a thread pool.
+	Returns the messages in the same order as filepaths; the first
+	failure is raised.
+
+	On free-threaded Python builds this scales across cores, without
+	the pickling cost of a process pool.
+	"""
+
+	def parse_one(filepath):
+		msg = parse_file(filepath, msgtype)
+		if validate:
+			msg.validate()
+		return msg
+
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		return list(executor.map(parse_one, filepaths))
+
+def dedupe_files(filepaths, msgtype=None):
+
+	"""
+	Parse a stream of files, yielding (filepath, message) for each
+	message whose content hasn't been seen before in this stream.
+	Duplicates are detected by fingerprint(), so formatting doesn't matter.
+	"""
+
+	seen = set()
+
+	for filepath in filepaths:
+
+		msg = parse_file(filepath, msgtype)
+		fingerprint = msg.fingerprint()
+
+		if fingerprint in seen:
+			continue
+
+		seen.add(fingerprint)
+		yield filepath, msg
+
 def parse_etree(tree, msgtype=None):
 
 	"""
@@ -51,14 +183,7 @@ def parse_etree(tree, msgtype=None):
 	nodeinfo = __extract_nsinfo__(node)
 
 	# Get the class that we'll use to parse this node.
-	try:
-		msg_class = getattr(iso20022, nodeinfo.tagname)
-	except AttributeError:
-		try:
-			msg_class_outer = getattr(iso20022, nodeinfo.msgtype_normalised)
-			msg_class = getattr(msg_class_outer, nodeinfo.tagname)
-		except AttributeError:
-			raise iso20022.ParseError(f"No class for messages of type {nodeinfo.msgtype+':' if nodeinfo.msgtype is not None else ''}{classname}")
+	msg_class = __message_class__(nodeinfo)
 
 	# Create a new item of this class.
 	msg = msg_class(data=nodeinfo.data, tag = nodeinfo.tagname, ns=nodeinfo.ns)
@@ -66,17 +191,45 @@ def parse_etree(tree, msgtype=None):
 
 	return msg
 
+def get_message_class(tag):
+
+	"""
+	The class for a root element, e.g.
+	{urn:iso:std:iso:20022:tech:xsd:pain.002.001.14}Document
+	"""
+
+	return __message_class__(__extract_taginfo__(tag))
+
+def __message_class__(nodeinfo):
+
+	classes = message_classes()
+
+	try:
+		return getattr(classes, nodeinfo.tagname)
+	except AttributeError:
+		try:
+			msg_class_outer = getattr(classes, nodeinfo.msgtype_normalised)
+			return getattr(msg_class_outer, nodeinfo.tagname)
+		except (AttributeError, TypeError):
+			raise ParseError(f"No class for messages of type {nodeinfo.msgtype+':' if nodeinfo.msgtype is not None else ''}{nodeinfo.tagname}")
+
 def __extract_nsinfo__(node):
+	return __extract_taginfo__(node.tag, node.text)
+
+def __extract_taginfo__(tag, data=None):
 
 	# Attempt to pull out namespace and tag type.
 	try:
-		matches = re.match(r"^(\{(([^\{\}:]*:)*([^\{\}:]*))\})?([^\{\}:]*)$", node.tag)
+		matches = re.match(r"^(\{(([^\{\}:]*:)*([^\{\}:]*))\})?([^\{\}:]*)$", tag)
 	except:
-		raise ValueError(f"Could not extract info from node {node}")
+		raise ValueError(f"Could not extract info from tag {tag}")
 	else:
+		if matches is None:
+			raise ValueError(f"Could not extract info from tag {tag}")
+
 		ns = matches.group(2)
 		msgtype = matches.group(4)
 		tagname = matches.group(5)
 		normalised_msgtype = None if msgtype is None else msgtype.replace(".", "_").upper()
 
-		return __node_info__(ns, msgtype, tagname, normalised_msgtype, node.text)
\ No newline at end of file
+		return __node_info__(ns, msgtype, tagname, normalised_msgtype, data)
@@ -0,0 +1,271 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+"""
+Precomputed schema metadata.
+
+Importing the message classes builds every class and every FieldEntry /
+AttributeEntry up front. A snapshot stores the same metadata (field
+tables, patterns, enums, bounds) in one compact file, and builds classes
+from it only when they're asked for.
+
+Build one with:
+    python snapshot.py build iso20022.snap
+
+and use it with parsers.use_snapshot("iso20022.snap"), by setting
+ISO20022_SNAPSHOT=iso20022.snap, or with --snapshot on daemon.py and
+mutate.py.
+
+Compare cold "load classes and parse one message" times with:
+    python snapshot.py time iso20022.snap message.xml
+"""
+
+import sys
+import types
+import marshal
+import threading
+import hashlib
+
+import base_types
+from base_types import FieldEntry, AttributeEntry, _BaseElemType
+
+_MAGIC = b"ISOSNAP1"
+
+# Entries in a class dict that are never schema metadata.
+_IGNORED_ATTRS = {"__module__", "__qualname__", "__doc__", "__dict__", "__weakref__", "_field_defs", "_attrib_defs"}
+
+def build_snapshot(package, path):
+
+	"""
+	Write a snapshot of every message class in package (and its
+	submodules) to path.
+	"""
+
+	modules = [package] + [ m for m in vars(package).values() if isinstance(m, types.ModuleType) and m.__name__.startswith(package.__name__ + ".") ]
+
+	classes = {}
+	names = {}
+
+	for module in modules:
+
+		prefix = module.__name__[len(package.__name__)+1:]
+		prefix = f"{prefix}." if prefix else ""
+
+		for name, cls in vars(module).items():
+			if isinstance(cls, type) and issubclass(cls, _BaseElemType) and cls.__module__ != base_types.__name__:
+				names[f"{prefix}{name}"] = __class_key__(cls)
+				__record_class__(cls, classes)
+
+	snapshot = {
+		"python": tuple(sys.version_info[:2]),
+		"classes": classes,
+		"names": names,
+	}
+
+	with open(path, "wb") as f:
+		f.write(_MAGIC)
+		f.write(marshal.dumps(snapshot))
+
+def __class_key__(cls):
+	return f"{cls.__module__}:{cls.__qualname__}"
+
+def __record_class__(cls, classes):
+
+	key = __class_key__(cls)
+	if key in classes:
+		return
+
+	# Placeholder, in case of recursive definitions.
+	classes[key] = None
+
+	# The base_types class we'll rebuild on top of.
+	base = next(c for c in cls.__mro__ if c.__module__ == base_types.__name__)
+
+	attrs = {}
+	needs_import = False
+
+	for c in reversed(cls.__mro__[:cls.__mro__.index(base)]):
+		for name, value in vars(c).items():
+			if name in _IGNORED_ATTRS:
+				continue
+			if isinstance(value, set):
+				value = frozenset(value)
+			try:
+				marshal.dumps(value)
+			except ValueError:
+				# Methods, or values we can't store. Import the real class instead.
+				needs_import = True
+				break
+			attrs[name] = value
+
+	fields = None
+	if getattr(cls, "_field_defs", None):
+		fields = []
+		for fd in cls._field_defs:
+			__record_class__(fd.type, classes)
+			fields.append((fd.name, __class_key__(fd.type), fd.min, fd.max, fd.mutex_group, fd.array))
+		fields = tuple(fields)
+
+	attribs = None
+	if cls._attrib_defs is not None:
+		attribs = []
+		for ad in cls._attrib_defs:
+			__record_class__(ad.type, classes)
+			attribs.append((ad.name, __class_key__(ad.type), ad.required))
+		attribs = tuple(attribs)
+
+	classes[key] = {
+		"module": cls.__module__,
+		"name": cls.__qualname__,
+		"base": base.__name__,
+		"import": needs_import,
+		"attrs": None if needs_import else attrs,
+		"fields": fields,
+		"attribs": attribs,
+	}
+
+class SchemaSnapshot(object):
+
+	"""
+	Loads a snapshot, and builds classes from it on demand. Classes are
+	looked up the same way as on the package, e.g.:
+		snap = SchemaSnapshot("iso20022.snap")
+		snap.Max35Text
+		snap.PAIN_002_001_14.Document
+	"""
+
+	def __init__(self, path):
+
+		with open(path, "rb") as f:
+			data = f.read()
+
+		if data[:len(_MAGIC)] != _MAGIC:
+			raise ValueError(f"{path} : Not a schema snapshot")
+		snapshot = marshal.loads(data[len(_MAGIC):])
+
+		# Identifies the classes, see parsers.schema_version().
+		self.digest = hashlib.sha256(data).hexdigest()
+
+		if tuple(snapshot["python"]) != tuple(sys.version_info[:2]):
+			raise ValueError(f"{path} : Snapshot was built with a different Python version")
+
+		self._classes = snapshot["classes"]
+		self._names = snapshot["names"]
+		self._built = {}
+		self._lock = threading.Lock()
+
+		self._prefixes = set()
+		for name in self._names:
+			parts = name.split(".")[:-1]
+			for i in range(1, len(parts)+1):
+				self._prefixes.add(".".join(parts[:i]))
+
+	def __getattr__(self, name):
+		return self.load(name)
+
+	def load(self, name):
+
+		if name in self._names:
+			return self._build(self._names[name])
+
+		if name in self._prefixes:
+			return _SnapshotNamespace(self, name)
+
+		raise AttributeError(name)
+
+	def _build(self, key):
+
+		try:
+			return self._built[key]
+		except KeyError:
+			pass
+
+		# Classes are built under the lock, and only published once their
+		# fields are resolved, so other threads never see one half-built.
+		with self._lock:
+			building = {}
+			cls = self._resolve(key, building)
+			self._built.update(building)
+
+		return cls
+
+	def _resolve(self, key, building):
+
+		cls = self._built.get(key) or building.get(key)
+		if cls is not None:
+			return cls
+
+		record = self._classes[key]
+
+		if record["import"]:
+			module = __import__(record["module"], fromlist=[record["name"]])
+			cls = building[key] = getattr(module, record["name"])
+			return cls
+
+		attrs = dict(record["attrs"])
+		attrs["__module__"] = record["module"]
+		attrs["__qualname__"] = record["name"]
+
+		cls = type(record["name"], (getattr(base_types, record["base"]),), attrs)
+
+		# Register before resolving fields, in case of recursive definitions.
+		building[key] = cls
+
+		if record["fields"] is not None:
+			cls._field_defs = tuple(
+				FieldEntry(name, self._resolve(type_key, building), min, max, mutex_group, array)
+				for name, type_key, min, max, mutex_group, array in record["fields"]
+			)
+			for field_def in cls._field_defs:
+				if not hasattr(cls, field_def.name):
+					setattr(cls, field_def.name, None)
+
+		if record["attribs"] is not None:
+			cls._attrib_defs = tuple(
+				AttributeEntry(name, self._resolve(type_key, building), required)
+				for name, type_key, required in record["attribs"]
+			)
+
+		return cls
+
+class _SnapshotNamespace(object):
+
+	def __init__(self, snapshot, prefix):
+
+		self._snapshot = snapshot
+		self._prefix = prefix
+
+	def __getattr__(self, name):
+		return self._snapshot.load(f"{self._prefix}.{name}")
+
+def __time_cold_start__(path, xml_path, runs=5):
+
+	# Each run is a fresh interpreter that loads the classes and parses
+	# one message, so this is what a short script pays before doing any work.
+	import subprocess
+	import time
+
+	cmds = {
+		"import iso20022 + parse": f"import parsers; parsers.use_snapshot(None); parsers.parse_file({xml_path!r})",
+		"load snapshot + parse": f"import parsers; parsers.use_snapshot({path!r}); parsers.parse_file({xml_path!r})",
+	}
+
+	for label, cmd in cmds.items():
+		timings = []
+		for _ in range(runs):
+			start = time.perf_counter()
+			subprocess.run([sys.executable, "-c", cmd], check=True)
+			timings.append(time.perf_counter() - start)
+		print(f"{label}: best of {runs} = {min(timings)*1000:.1f}ms")
+
+if __name__ == "__main__":
+
+	if len(sys.argv) == 3 and sys.argv[1] == "build":
+		import iso20022
+		build_snapshot(iso20022, sys.argv[2])
+	elif len(sys.argv) == 4 and sys.argv[1] == "time":
+		__time_cold_start__(sys.argv[2], sys.argv[3])
+	else:
+		print(f"Usage: {sys.argv[0]} build <snapshot path>")
+		print(f"       {sys.argv[0]} time <snapshot path> <message path>")
+		sys.exit(1)
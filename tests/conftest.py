@@ -0,0 +1,19 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import os
+import sys
+
+# The library is a set of top-level modules in the project root. The
+# generated message package isn't part of this tree, so the tests use a
+# small stand-in for it (tests/fixtures/iso20022).
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, FIXTURES)
+
+SAMPLE_MSG = os.path.join(FIXTURES, "msgs", "test.001.001.01.xml")
+
+# An XSD for the stand-in message, for validation's xsd engine.
+SCHEMA_DIR = os.path.join(FIXTURES, "schemas")
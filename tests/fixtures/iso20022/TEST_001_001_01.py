@@ -0,0 +1,11 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+from base_types import FieldEntry, _BaseFieldType
+from iso20022 import Message
+
+class Document(_BaseFieldType):
+	_field_defs = (
+		FieldEntry("Msg", Message, 1, 1, None, False),
+	)
+	Msg = None
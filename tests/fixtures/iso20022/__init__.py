@@ -0,0 +1,88 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+# A small stand-in for the generated message package, laid out the same
+# way, with one message type: test.001.001.01 (see TEST_001_001_01.py).
+
+from exceptions import *
+from base_types import *
+from parsers import *
+from base_types import _BaseFieldType, _BaseDataType_String, _BaseDataType_Decimal, _BaseDataType_Date, _BaseDataType_DateTime, _BaseDataType_Boolean
+
+class Max35Text(_BaseDataType_String):
+	_min = 1
+	_max = 35
+
+class Max15NumericText(_BaseDataType_String):
+	_pattern = r"[0-9]{1,15}"
+
+class UUIDv4Identifier(_BaseDataType_String):
+	_pattern = r"[a-f0-9]{8}-[a-f0-9]{4}-4[a-f0-9]{3}-[89ab][a-f0-9]{3}-[a-f0-9]{12}"
+
+class BICFIIdentifier(_BaseDataType_String):
+	_pattern = r"[A-Z0-9]{4,4}[A-Z]{2,2}[A-Z0-9]{2,2}([A-Z0-9]{3,3}){0,1}"
+
+class ExternalCode4(_BaseDataType_String):
+	_values = {"ACCP", "RJCT", "PDNG"}
+
+class ActiveAmount(_BaseDataType_Decimal):
+	_max_totaldigits = 18
+	_max_fractiondigits = 5
+	_min_inclusive = 0
+
+class Rate(_BaseDataType_Decimal):
+	_max_totaldigits = 11
+	_max_fractiondigits = 10
+	_min_inclusive = -1
+	_max_inclusive = 1
+
+class ISODate(_BaseDataType_Date):
+	pass
+
+class ISODateTime(_BaseDataType_DateTime):
+	pass
+
+class TrueFalseIndicator(_BaseDataType_Boolean):
+	pass
+
+class GroupHeader(_BaseFieldType):
+	_field_defs = (
+		FieldEntry("MsgId", Max35Text, 1, 1, None, False),
+		FieldEntry("CreDtTm", ISODateTime, 1, 1, None, False),
+		FieldEntry("NbOfTxs", Max15NumericText, 1, 1, None, False),
+	)
+	MsgId = None
+	CreDtTm = None
+	NbOfTxs = None
+
+class Transaction(_BaseFieldType):
+	_field_defs = (
+		FieldEntry("EndToEndId", Max35Text, 1, 1, None, False),
+		FieldEntry("UETR", UUIDv4Identifier, 0, 1, None, False),
+		FieldEntry("Amt", ActiveAmount, 0, 1, 1, False),
+		FieldEntry("Sts", ExternalCode4, 0, 1, 1, False),
+		FieldEntry("XchgRate", Rate, 0, 1, None, False),
+		FieldEntry("Agt", BICFIIdentifier, 0, 1, None, False),
+		FieldEntry("ReqdExctnDt", ISODate, 0, 1, None, False),
+		FieldEntry("Btch", TrueFalseIndicator, 0, 1, None, False),
+		FieldEntry("Rmt", Max35Text, 0, 3, None, True),
+	)
+	EndToEndId = None
+	UETR = None
+	Amt = None
+	Sts = None
+	XchgRate = None
+	Agt = None
+	ReqdExctnDt = None
+	Btch = None
+	Rmt = None
+
+class Message(_BaseFieldType):
+	_field_defs = (
+		FieldEntry("GrpHdr", GroupHeader, 1, 1, None, False),
+		FieldEntry("Tx", Transaction, 1, 5, None, True),
+	)
+	GrpHdr = None
+	Tx = None
+
+from . import TEST_001_001_01
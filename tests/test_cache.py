@@ -0,0 +1,188 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import os
+import shutil
+import pickle
+import types
+
+import pytest
+
+import iso20022
+import parsers
+import snapshot
+import cache
+from conftest import SAMPLE_MSG
+
+@pytest.fixture(autouse=True)
+def package_classes():
+
+	parsers.use_snapshot(None)
+	yield
+	parsers.use_snapshot(None)
+
+def __package_copy__(tmp_path):
+
+	# A copy of the message package, to edit.
+	directory = tmp_path / "iso20022"
+	shutil.copytree(iso20022.__path__[0], directory, ignore=shutil.ignore_patterns("__pycache__"))
+
+	package = types.ModuleType("iso20022")
+	package.__path__ = [str(directory)]
+	return package, directory
+
+def test_schema_version_is_stable():
+
+	version = parsers.schema_version()
+
+	assert len(version) == 64
+	assert version == parsers.schema_version()
+	assert version == parsers.__schema_version__(iso20022)
+
+def test_schema_version_follows_class_sources(tmp_path):
+
+	package, directory = __package_copy__(tmp_path)
+	before = parsers.__schema_version__(package)
+
+	assert before == parsers.schema_version()
+
+	# Any change to a message class gives a new version.
+	path = directory / "TEST_001_001_01.py"
+	path.write_text(path.read_text() + "\n# changed\n")
+
+	assert parsers.__schema_version__(package) != before
+
+def test_schema_version_prefers_explicit_version(tmp_path):
+
+	package, directory = __package_copy__(tmp_path)
+	package.__version__ = "2025.1"
+	before = parsers.__schema_version__(package)
+
+	(directory / "TEST_001_001_01.py").write_text("# changed\n")
+	assert parsers.__schema_version__(package) == before
+
+	package.__version__ = "2025.2"
+	assert parsers.__schema_version__(package) != before
+
+def test_schema_version_for_snapshot(tmp_path):
+
+	package_version = parsers.schema_version()
+
+	path = str(tmp_path / "iso20022.snap")
+	snapshot.build_snapshot(iso20022, path)
+	parsers.use_snapshot(path)
+
+	assert parsers.schema_version() != package_version
+	assert parsers.schema_version() == parsers.__schema_version__(snapshot.SchemaSnapshot(path))
+
+def test_cache_hits(tmp_path):
+
+	msg_cache = cache.MessageCache(directory=str(tmp_path))
+
+	first = msg_cache.parse_file(SAMPLE_MSG, validate=True)
+	second = msg_cache.parse_file(SAMPLE_MSG, validate=True)
+
+	assert first == second and first is not second
+	assert msg_cache.stats()["hits"] == 1
+
+	# A new cache finds it on disk.
+	msg_cache = cache.MessageCache(directory=str(tmp_path))
+	assert msg_cache.parse_file(SAMPLE_MSG) == first
+	assert msg_cache.stats()["disk_hits"] == 1
+
+def test_cache_misses_after_schema_change(tmp_path, monkeypatch):
+
+	msg_cache = cache.MessageCache(directory=str(tmp_path))
+	msg_cache.parse_file(SAMPLE_MSG)
+
+	# Pickles from other classes are never returned.
+	monkeypatch.setattr(parsers, "_schema_version", "other")
+
+	msg_cache = cache.MessageCache(directory=str(tmp_path))
+	msg_cache.parse_file(SAMPLE_MSG)
+
+	assert msg_cache.stats()["hits"] == 0
+	assert msg_cache.stats()["misses"] == 1
+
+def __variants__(count):
+
+	# The sample message, with a different MsgId each time (and so the
+	# same pickled size).
+	with open(SAMPLE_MSG) as f:
+		xml = f.read()
+
+	return [ xml.replace("MSG-0001", f"MSG-{i:04}") for i in range(count) ]
+
+def __pickled_size__(xml):
+	return len(pickle.dumps(parsers.parse_xml(xml), pickle.HIGHEST_PROTOCOL))
+
+def test_cache_evicts_least_recently_used():
+
+	a, b, c = __variants__(3)
+	msg_cache = cache.MessageCache(max_bytes=int(2.5 * __pickled_size__(a)))
+
+	msg_cache.parse_xml(a)
+	msg_cache.parse_xml(b)
+	msg_cache.parse_xml(a)
+	msg_cache.parse_xml(c)
+
+	stats = msg_cache.stats()
+	assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (1, 3, 1, 2)
+	assert stats["bytes"] <= msg_cache.max_bytes
+
+	# b went, as a had been used since.
+	msg_cache.parse_xml(a)
+	msg_cache.parse_xml(b)
+	assert (msg_cache.stats()["hits"], msg_cache.stats()["misses"]) == (2, 4)
+
+def test_cache_bounds_the_directory(tmp_path):
+
+	xmls = __variants__(4)
+	entry_size = __pickled_size__(xmls[0]) + 1
+
+	msg_cache = cache.MessageCache(directory=str(tmp_path), max_disk_bytes=int(2.5 * entry_size))
+	for xml in xmls[:3]:
+		msg_cache.parse_xml(xml)
+
+	stats = msg_cache.stats()
+	assert (stats["disk_entries"], stats["disk_bytes"], stats["disk_evictions"]) == (2, 2 * entry_size, 1)
+	assert len(list(tmp_path.iterdir())) == 2
+
+	# (Spread out the times, which may otherwise tie.)
+	for i, key in enumerate(msg_cache._disk):
+		os.utime(msg_cache._path(key), (1_700_000_000 + i, 1_700_000_000 + i))
+
+	# A new cache picks up what's there, and trims it to its own bound.
+	msg_cache = cache.MessageCache(directory=str(tmp_path), max_disk_bytes=int(1.5 * entry_size))
+	assert msg_cache.stats()["disk_entries"] == 1
+	assert len(list(tmp_path.iterdir())) == 1
+
+	# The newest survived.
+	msg_cache.parse_xml(xmls[2])
+	assert msg_cache.stats()["disk_hits"] == 1
+
+def test_validated_hits_skip_validation(tmp_path, monkeypatch):
+
+	calls = []
+	validate = iso20022.TEST_001_001_01.Document.validate
+
+	def counted(self, *args, **kwargs):
+		calls.append(self)
+		return validate(self, *args, **kwargs)
+
+	monkeypatch.setattr(iso20022.TEST_001_001_01.Document, "validate", counted)
+
+	msg_cache = cache.MessageCache(directory=str(tmp_path))
+	msg_cache.parse_file(SAMPLE_MSG)
+	assert len(calls) == 0
+
+	# Validated once, on the first hit that asks for it...
+	for _ in range(3):
+		msg_cache.parse_file(SAMPLE_MSG, validate=True)
+	assert len(calls) == 1
+
+	# ...and that's remembered on disk too.
+	msg_cache = cache.MessageCache(directory=str(tmp_path))
+	msg_cache.parse_file(SAMPLE_MSG, validate=True)
+	assert len(calls) == 1
+	assert msg_cache.stats()["disk_hits"] == 1
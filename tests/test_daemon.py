@@ -0,0 +1,136 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import os
+import sys
+import socket
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+import pytest
+
+import daemon
+import parsers
+import mutate
+from conftest import ROOT, SAMPLE_MSG
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+
+	path = str(tmp_path_factory.mktemp("daemon") / "iso20022.sock")
+
+	d = daemon.Daemon(processes=2, preload=("test.001.001.01",))
+	d.listen_unix(path)
+	http_server = d.listen_http(0)
+
+	thread = threading.Thread(target=d.serve_forever, daemon=True)
+	thread.start()
+
+	yield path, f"http://127.0.0.1:{http_server.server_address[1]}", http_server.token
+
+	d.close()
+
+@pytest.fixture
+def unix_address(server):
+	return server[0]
+
+@pytest.fixture(params=["unix", "http"])
+def client(request, server):
+
+	path, url, token = server
+
+	with daemon.DaemonClient(path) if request.param == "unix" else daemon.DaemonClient(url, token) as client:
+		yield client
+
+def test_client_doesnt_load_message_classes(unix_address):
+
+	# A fresh interpreter, so we can see what the client pulls in.
+	script = f"""
+import sys
+sys.path[:0] = [{ROOT!r}]
+import daemon
+client = daemon.DaemonClient({unix_address!r})
+issues = client.validate_xml(open({SAMPLE_MSG!r}).read().replace("MSG-0001", "x" * 36))
+print(repr(issues))
+print(sorted(m for m in ("validation", "iso20022", "hypothesis", "base_types") if m in sys.modules))
+"""
+
+	out = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout.splitlines()
+
+	assert out == [
+		"[ValidationIssue(path='Document.Msg.GrpHdr.MsgId', message='Invalid value')]",
+		"[]",
+	]
+
+def test_issues_match_the_library(client):
+
+	import validation
+
+	with open(SAMPLE_MSG) as f:
+		xml = f.read().replace("ACCP", "NOPE")
+
+	assert client.validate_xml(xml) == validation.validate_xml(xml)
+
+def test_batches(client):
+
+	assert client.request([]) == []
+	assert client.parse_files([]) == []
+
+	summaries = client.parse_files([SAMPLE_MSG] * 3)
+	assert len(summaries) == 3 and summaries[0].tag == "Document"
+
+def test_convert_round_trips(client):
+
+	msg = parsers.parse_file(SAMPLE_MSG)
+	msg.Msg.Tx[0].Rmt[0].set("<b>Smith & Sons</b>")
+
+	xml = client.convert(xml=mutate.compact_xml(msg))
+
+	assert parsers.parse_xml(xml) == msg
+	assert client.convert(SAMPLE_MSG) == mutate.compact_xml(parsers.parse_file(SAMPLE_MSG))
+
+def test_http_batch_needs_one_op(server):
+
+	with daemon.DaemonClient(server[1], server[2]) as client:
+		with pytest.raises(ValueError):
+			client.request([{"op": "parse", "path": SAMPLE_MSG}, {"op": "validate", "path": SAMPLE_MSG}])
+
+@pytest.mark.parametrize("token", [None, "", "wrong", "x" * 43])
+def test_http_needs_the_token(server, token):
+
+	with daemon.DaemonClient(server[1], token) as client:
+		for _ in range(2):
+			# (And the connection stays usable afterwards.)
+			with pytest.raises(PermissionError):
+				client.convert(SAMPLE_MSG)
+
+	# Nor can the header be bent to fit.
+	for header in (f"Bearer  {server[2]}", f"bearer {server[2]}", f"Bearer {server[2]}x", server[2]):
+		conn = http.client.HTTPConnection(*urlsplit(server[1]).netloc.split(":"))
+		conn.request("POST", "/convert", body=b'{"path": "/etc/passwd"}', headers={"Authorization": header})
+		assert conn.getresponse().status == 401
+		conn.close()
+
+def test_http_checks_the_token_before_the_body(server):
+
+	# A body that never arrives isn't waited for.
+	with socket.create_connection(urlsplit(server[1]).netloc.split(":"), timeout=5) as sock:
+		sock.sendall(b"POST /convert HTTP/1.1\r\nHost: x\r\nContent-Length: 1000000000\r\n\r\n")
+		response = sock.makefile("rb").read()
+
+	assert response.startswith(b"HTTP/1.1 401 ")
+
+def test_load_token(tmp_path):
+
+	path = str(tmp_path / "token")
+
+	token = daemon.load_token(path)
+	assert len(token) >= 32
+	assert os.stat(path).st_mode & 0o777 == 0o600
+	assert daemon.load_token(path) == token
+
+	os.chmod(path, 0o644)
+	with pytest.raises(ValueError):
+		daemon.load_token(path)
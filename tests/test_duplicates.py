@@ -0,0 +1,131 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import pytest
+
+import duplicates
+import parsers
+import xml_backends
+from duplicates import Reference
+from conftest import SAMPLE_MSG
+
+# All the indexes start their clocks here.
+T0 = 1_700_000_000.0
+
+SAMPLE_REFS = [
+	Reference("MsgId", "MSG-0001"),
+	Reference("EndToEndId", "E2E-0001"),
+	Reference("UETR", "5f1c3c2e-8a4b-4c1d-9e2f-0123456789ab"),
+	Reference("EndToEndId", "E2E-0002"),
+]
+
+@pytest.fixture(params=["memory", "file"])
+def bloom(request, tmp_path):
+
+	path = None if request.param == "memory" else str(tmp_path / "refs.bloom")
+	index = duplicates.BloomDuplicateIndex(1000, window=10, path=path, now=T0)
+	yield index
+	index.close()
+
+@pytest.fixture(params=["exact", "bloom"])
+def index(request):
+
+	if request.param == "exact":
+		return duplicates.DuplicateIndex(window=10)
+
+	return duplicates.BloomDuplicateIndex(1000, window=10, now=T0)
+
+def test_bloom_remembers_within_window(bloom):
+
+	assert not bloom.seen("MsgId", "A", T0)
+	assert bloom.seen("MsgId", "A", T0 + 5)
+	# Rotated once, so still in the older filter.
+	assert bloom.seen("MsgId", "A", T0 + 12)
+
+def test_bloom_forgets_after_idle_gap(bloom):
+
+	assert not bloom.seen("MsgId", "A", T0 + 1)
+	# Two windows or more later, both filters have to be cleared.
+	assert not bloom.seen("MsgId", "A", T0 + 50)
+
+def test_bloom_forgets_after_two_rotations(bloom):
+
+	assert not bloom.seen("MsgId", "A", T0 + 1)
+	assert not bloom.seen("MsgId", "B", T0 + 11)
+	assert not bloom.seen("MsgId", "C", T0 + 22)
+	assert not bloom.seen("MsgId", "A", T0 + 23)
+
+def test_bloom_file_survives_restart(tmp_path):
+
+	path = str(tmp_path / "refs.bloom")
+
+	index = duplicates.BloomDuplicateIndex(1000, window=10, path=path, now=T0)
+	assert not index.seen("MsgId", "A", T0 + 1)
+	assert not index.seen("MsgId", "B", T0 + 11)
+	index.close()
+
+	# The windows carry on from the file, not from the new start time.
+	index = duplicates.BloomDuplicateIndex(1000, window=10, path=path, now=T0 + 100)
+	assert index.seen("MsgId", "A", T0 + 12)
+	assert index.seen("MsgId", "B", T0 + 12)
+	assert not index.seen("MsgId", "C", T0 + 12)
+	# Next rotation drops A's filter.
+	assert not index.seen("MsgId", "A", T0 + 22)
+	index.close()
+
+	with pytest.raises(ValueError):
+		duplicates.BloomDuplicateIndex(2000, window=10, path=path)
+
+def test_exact_index_window():
+
+	index = duplicates.DuplicateIndex(window=10)
+
+	assert not index.seen("EndToEndId", "E1", T0)
+	assert index.seen("EndToEndId", "E1", T0 + 9)
+	assert not index.seen("EndToEndId", "E1", T0 + 20)
+
+def test_references_from_every_source():
+
+	assert duplicates.extract_references(parsers.parse_file(SAMPLE_MSG)) == SAMPLE_REFS
+	assert duplicates.extract_references(xml_backends.get_backend().parse(SAMPLE_MSG)) == SAMPLE_REFS
+	assert duplicates.extract_references_file(SAMPLE_MSG) == SAMPLE_REFS
+
+def test_check(index):
+
+	assert index.check(SAMPLE_MSG, T0) == []
+	assert index.check(parsers.parse_file(SAMPLE_MSG), T0 + 1) == SAMPLE_REFS
+
+	# Another message reusing one reference.
+	msg = parsers.parse_file(SAMPLE_MSG)
+	msg.Msg.GrpHdr.MsgId.set("MSG-0002")
+	msg.Msg.Tx[0].UETR.set("00000000-0000-4000-8000-000000000000")
+	msg.Msg.Tx[1].EndToEndId.set("E2E-0003")
+	assert index.check(msg, T0 + 2) == [Reference("EndToEndId", "E2E-0001")]
+
+	# Long enough later, it's all new again.
+	assert index.check(SAMPLE_MSG, T0 + 30) == []
+
+def test_save_and_load(tmp_path):
+
+	path = str(tmp_path / "refs")
+
+	saved = duplicates.DuplicateIndex(window=10)
+	saved.seen("MsgId", "A", T0)
+	saved.seen("MsgId", "B", T0 + 4)
+	saved.save(path)
+
+	index = duplicates.DuplicateIndex(window=10)
+	index.seen("MsgId", "C", T0 + 2)
+	index.seen("MsgId", "B", T0 + 8)
+	index.load(path)
+	assert len(index) == 3
+
+	# A (the oldest, though loaded last) goes first, then C; B keeps its
+	# earlier time, so goes before D would.
+	assert not index.seen("MsgId", "D", T0 + 11)
+	assert len(index) == 3
+	assert index.seen("MsgId", "C", T0 + 11)
+	assert not index.seen("MsgId", "A", T0 + 11)
+	assert index.seen("MsgId", "B", T0 + 13)
+	assert not index.seen("MsgId", "B", T0 + 15)
+	assert index.seen("MsgId", "D", T0 + 15)
@@ -0,0 +1,114 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import gc
+import copy
+import pickle
+import weakref
+
+import pytest
+
+import parsers
+import mutate
+from conftest import SAMPLE_MSG
+
+@pytest.fixture
+def msg():
+	return parsers.parse_file(SAMPLE_MSG)
+
+@pytest.fixture
+def compact(tmp_path, msg):
+
+	# The same message, written out without any whitespace.
+	path = str(tmp_path / "compact.xml")
+	with open(path, "w") as f:
+		f.write(mutate.compact_xml(msg))
+
+	return path
+
+def test_formatting_doesnt_matter(msg, compact):
+
+	other = parsers.parse_file(compact)
+
+	assert other.fingerprint() == msg.fingerprint()
+	assert other == msg
+	assert hash(other) == hash(msg)
+
+def test_a_changed_leaf_changes_the_fingerprint(msg):
+
+	other = parsers.parse_file(SAMPLE_MSG)
+	other.Msg.Tx[0].Rmt[1].set("Invoice 3")
+
+	assert other.fingerprint() != msg.fingerprint()
+	assert other != msg
+
+def test_set_invalidates(msg):
+
+	before = msg.fingerprint()
+
+	msg.Msg.GrpHdr.MsgId.set("MSG-0002")
+	assert msg.fingerprint() != before
+
+	msg.Msg.GrpHdr.MsgId.set("MSG-0001")
+	assert msg.fingerprint() == before
+
+def test_field_assignment_invalidates(msg):
+
+	before = msg.fingerprint()
+
+	msg.Msg.Tx[1].Sts = None
+	assert msg.fingerprint() != before
+
+	# (And the new field is hooked up, so editing it invalidates too.)
+	msg.Msg.Tx[1].Sts = copy.deepcopy(parsers.parse_file(SAMPLE_MSG).Msg.Tx[1].Sts)
+	assert msg.fingerprint() == before
+
+	msg.Msg.Tx[1].Sts.set("RJCT")
+	assert msg.fingerprint() != before
+
+def test_copies_keep_invalidating(msg):
+
+	before = msg.fingerprint()
+
+	for other in (copy.deepcopy(msg), pickle.loads(pickle.dumps(msg))):
+		assert other.fingerprint() == before
+		other.Msg.Tx[0].Amt.set("1.00")
+		assert other.fingerprint() != before
+
+	assert msg.fingerprint() == before
+
+def test_sets_and_dicts_dedupe(msg, compact):
+
+	other = parsers.parse_file(SAMPLE_MSG)
+	other.Msg.GrpHdr.MsgId.set("MSG-0002")
+
+	msgs = [msg, parsers.parse_file(compact), other, parsers.parse_file(SAMPLE_MSG)]
+
+	assert len(set(msgs)) == 2
+	assert parsers.parse_file(compact) in set(msgs)
+	assert {m: i for i, m in enumerate(msgs)} == {msg: 3, other: 2}
+
+def test_dedupe_files_drops_reformatted_duplicates(tmp_path, compact):
+
+	other = parsers.parse_file(SAMPLE_MSG)
+	other.Msg.GrpHdr.MsgId.set("MSG-0002")
+	other_path = str(tmp_path / "other.xml")
+	with open(other_path, "w") as f:
+		f.write(mutate.compact_xml(other))
+
+	kept = [ path for path, _ in parsers.dedupe_files([SAMPLE_MSG, compact, other_path, SAMPLE_MSG]) ]
+
+	assert kept == [SAMPLE_MSG, other_path]
+
+def test_dropped_messages_are_freed_without_gc():
+
+	msg = parsers.parse_file(SAMPLE_MSG)
+	msg.fingerprint()
+	leaf = weakref.ref(msg.Msg.Tx[0].Amt)
+
+	gc.disable()
+	try:
+		del msg
+		assert leaf() is None
+	finally:
+		gc.enable()
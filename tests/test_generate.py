@@ -0,0 +1,128 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import re
+from datetime import date, time, datetime
+from decimal import Decimal
+
+import pytest
+from hypothesis import given, settings, strategies as st
+
+import iso20022
+import validation
+from base_types import _BaseDataType, _BaseDataType_Decimal, _BaseDataType_Date, _BaseDataType_Time, _BaseDataType_gYear, _BaseDataType_gYearMonth, _BaseDataType_gMonth, _BaseDataType_DateTime
+
+RUNS = 300
+
+# Every leaf class in the fixture package.
+LEAF_CLASSES = [
+	cls for cls in vars(iso20022).values()
+	if isinstance(cls, type) and issubclass(cls, _BaseDataType) and cls.__module__ == iso20022.__name__
+]
+
+class _Time(_BaseDataType_Time):
+	pass
+
+class _gYear(_BaseDataType_gYear):
+	pass
+
+class _gYearMonth(_BaseDataType_gYearMonth):
+	pass
+
+class _gMonth(_BaseDataType_gMonth):
+	pass
+
+# Offsets, as XSD allows them.
+_TZ = r"(Z|[+-](0[0-9]|1[0-3]):[0-5][0-9]|[+-]14:00)?"
+
+# Type -> (check that the value is a real date/time, pattern it must match)
+CALENDAR_CHECKS = {
+	iso20022.ISODate: (date.fromisoformat, None),
+	iso20022.ISODateTime: (lambda v: datetime.fromisoformat(v.replace("Z", "+00:00")), r"[^T]+T[0-9:.]+" + _TZ),
+	_Time: (lambda v: time.fromisoformat(v.replace("Z", "+00:00")), r"[0-9:.]+" + _TZ),
+	_gYear: (lambda v: date(int(v[:4]), 1, 1), r"[0-9]{4}" + _TZ),
+	_gYearMonth: (lambda v: date(int(v[:4]), int(v[5:7]), 1), r"[0-9]{4}-[0-9]{2}" + _TZ),
+	_gMonth: (lambda v: date(2000, int(v[:2]), 1), r"[0-9]{2}" + _TZ),
+}
+
+@pytest.mark.parametrize("cls", LEAF_CLASSES, ids=lambda cls: cls.__name__)
+def test_generated_leaves_validate(cls):
+
+	leaves = []
+	for _ in range(RUNS):
+		leaf = cls(cls.__name__)
+		leaf.generate()
+		assert leaf.validate(), leaf.get()
+		leaves.append(leaf)
+
+	assert cls._do_batch_validation(leaves) == []
+
+@pytest.mark.parametrize("cls", CALENDAR_CHECKS, ids=lambda cls: cls.__name__)
+def test_generated_dates_are_real(cls):
+
+	calendar_check, pattern = CALENDAR_CHECKS[cls]
+
+	for _ in range(RUNS):
+		leaf = cls(cls.__name__)
+		leaf.generate()
+		value = leaf.get()
+
+		assert leaf.validate(), value
+		calendar_check(value)
+		if pattern is not None:
+			assert re.fullmatch(pattern, value), value
+
+@st.composite
+def decimal_facets(draw):
+
+	totaldigits = draw(st.integers(1, 30))
+	fractiondigits = draw(st.integers(0, 30))
+
+	# Bounds on the grid the sampler can reach, so there's always a value.
+	scale = min(fractiondigits, totaldigits - 1)
+	limit = 10 ** totaldigits - 1
+	bounds = sorted(draw(st.lists(st.integers(-limit, limit), min_size=2, max_size=2)))
+	lower, upper = ( Decimal(f"{b}E-{scale}") for b in bounds )
+
+	return type("_Decimal", (_BaseDataType_Decimal,), {
+		"_max_totaldigits": totaldigits,
+		"_max_fractiondigits": fractiondigits,
+		"_min_inclusive": draw(st.sampled_from((None, lower))),
+		"_max_inclusive": draw(st.sampled_from((None, upper))),
+	})
+
+@settings(max_examples=500, deadline=None)
+@given(decimal_facets())
+def test_generated_decimals_validate(cls):
+
+	leaf = cls("Amt")
+	leaf.generate()
+
+	assert leaf.validate(), leaf.get()
+	assert cls._do_batch_validation([leaf]) == []
+
+def test_generated_decimals_past_default_precision():
+
+	# Bounds with more digits than the default decimal context keeps.
+	cls = type("_Decimal", (_BaseDataType_Decimal,), {
+		"_max_totaldigits": 30,
+		"_max_fractiondigits": 0,
+		"_max_inclusive": Decimal("-" + "9" * 30),
+	})
+
+	leaf = cls("Amt")
+	leaf.generate()
+
+	assert leaf.get() == "-" + "9" * 30
+	assert leaf.validate()
+
+def test_generated_messages_validate():
+
+	msgs = []
+	for _ in range(RUNS):
+		msg = iso20022.TEST_001_001_01.Document("Document")
+		msg.generate()
+		assert msg.validate()
+		msgs.append(msg)
+
+	assert validation.validate_batched(msgs) == []
@@ -0,0 +1,68 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import copy
+
+import pytest
+
+import parsers
+import memory_report
+from conftest import SAMPLE_MSG
+
+@pytest.fixture
+def msg():
+	return parsers.parse_file(SAMPLE_MSG)
+
+def __elements__(elem):
+
+	yield elem
+	for child in elem._children():
+		yield from __elements__(child)
+
+def test_paths_nest(msg):
+
+	report = msg.memory_report()
+
+	assert report.by_path["Document"] == [report.total_bytes, report.total_objects]
+
+	for outer, inner in (("Document", "Document.Msg"), ("Document.Msg", "Document.Msg.Tx"), ("Document.Msg.Tx", "Document.Msg.Tx.Rmt")):
+		assert report.by_path[outer][0] > report.by_path[inner][0]
+		assert report.by_path[outer][1] > report.by_path[inner][1]
+
+	# Both transactions are under the one path.
+	assert report.by_path["Document.Msg.Tx.EndToEndId"][1] > report.by_path["Document.Msg.GrpHdr.MsgId"][1]
+
+def test_classes_add_up(msg):
+
+	report = msg.memory_report()
+
+	assert sum(size for size, _ in report.by_class.values()) == report.total_bytes
+	assert sum(objects for _, objects in report.by_class.values()) == report.total_objects
+	assert set(report.by_class) == { type(elem).__name__ for elem in __elements__(msg) }
+
+def test_parent_links_arent_counted(msg):
+
+	linked = copy.deepcopy(msg)
+	unlinked = copy.deepcopy(msg)
+	for elem in __elements__(unlinked):
+		elem.__dict__.pop("_parent", None)
+
+	report = linked.memory_report()
+	expected = unlinked.memory_report()
+	assert (report.total_bytes, report.total_objects) == (expected.total_bytes, expected.total_objects)
+	assert not any(path.count("Document") > 1 for path in report.by_path)
+
+def test_batch(msg):
+
+	small = parsers.parse_file(SAMPLE_MSG)
+	small.Msg.Tx.pop()
+	small.Msg.Tx[0].Rmt = None
+
+	report = memory_report.memory_report_batch([msg, small, msg])
+	single = msg.memory_report()
+
+	assert report.messages == 3
+	assert report.max_message_bytes == single.total_bytes
+	assert report.total_bytes == 2 * single.total_bytes + small.memory_report().total_bytes
+	assert report.by_path["Document"][0] == report.total_bytes
+	assert "3 message(s)" in report.format()
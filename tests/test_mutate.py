@@ -0,0 +1,108 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import os
+import collections
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import iso20022
+import parsers
+import validation
+import mutate
+from base_types import _BaseFieldType, FieldEntry, AttributeEntry
+from conftest import SAMPLE_MSG
+
+NS = "urn:iso:std:iso:20022:tech:xsd:test.001.001.01"
+
+@pytest.fixture
+def seed():
+	return parsers.parse_file(SAMPLE_MSG)
+
+def test_compact_xml_round_trips(seed):
+
+	seed.Msg.Tx[0].Rmt[0].set("<b>Smith & Sons</b> \"quoted\"")
+
+	xml = mutate.compact_xml(seed)
+	assert "\n" not in xml
+
+	parsed = parsers.parse_xml(xml)
+	assert parsed == seed
+	assert validation.validate_batched(parsed) == []
+
+class _Note(_BaseFieldType):
+	_attrib_defs = (
+		AttributeEntry("Lang", iso20022.Max35Text, True),
+	)
+	_field_defs = (
+		FieldEntry("Txt", iso20022.Max35Text, 1, 1, None, False),
+	)
+	Txt = None
+
+def test_compact_xml_writes_attributes():
+
+	xml = '<Note Lang="en &amp; fr"><Txt>Hi</Txt></Note>'
+	note = _Note("Note")
+	note.parse(ET.fromstring(xml))
+
+	assert mutate.compact_xml(note) == xml
+	assert note.validate()
+
+	before = note.fingerprint()
+	note.attrib["Lang"].set("de")
+	assert note.fingerprint() != before
+
+	# Elements without attributes don't get a dict of their own.
+	assert "attrib" not in vars(note.Txt)
+	assert len(note.Txt.attrib) == 0
+
+def test_compact_xml_round_trips_generated():
+
+	for _ in range(100):
+		msg = iso20022.TEST_001_001_01.Document("Document", ns=NS)
+		msg.generate()
+
+		# (Generated children have no namespace of their own, parsed
+		# ones do, so compare what's written out.)
+		xml = mutate.compact_xml(msg)
+		parsed = parsers.parse_xml(xml)
+		assert mutate.compact_xml(parsed) == xml
+		assert validation.validate_batched(parsed) == []
+
+@pytest.mark.parametrize("kind", mutate.MUTATIONS)
+def test_mutants_break_exactly_one_rule(seed, kind):
+
+	fingerprint = seed.fingerprint()
+	mutator = mutate.Mutator([seed], seed=0, kinds=(kind,))
+
+	for mutant in mutator.mutants(300):
+		assert mutant.kind == kind
+		issues = validation.validate_xml(mutant.xml)
+		assert len(issues) == 1, (mutant.path, issues, mutant.xml)
+
+	# Every mutation was undone.
+	assert seed.fingerprint() == fingerprint
+	assert validation.validate_batched(seed) == []
+
+def test_mutants_are_reproducible(seed):
+
+	first = [ m for m in mutate.Mutator([seed], seed=7, kinds=("enum", "pattern", "digits")).mutants(50) ]
+	second = [ m for m in mutate.Mutator([seed], seed=7, kinds=("enum", "pattern", "digits")).mutants(50) ]
+
+	assert first == second
+
+def test_fuzz_to_dir(tmp_path):
+
+	totals = mutate.fuzz_to_dir([SAMPLE_MSG], str(tmp_path), 40, processes=2, chunk_size=10)
+
+	assert sum(totals.values()) == 40
+	files = sorted(os.listdir(tmp_path))
+	assert len(files) == 40
+
+	counts = collections.Counter( name.rsplit("-", 1)[-1][:-len(".xml")] for name in files )
+	assert counts == totals
+
+	for name in files:
+		with open(tmp_path / name, "rb") as f:
+			assert len(validation.validate_xml(f.read())) == 1
@@ -0,0 +1,51 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import sys
+
+import pytest
+
+import iso20022
+import parsers
+import snapshot
+from conftest import SAMPLE_MSG
+
+@pytest.fixture
+def snap_path(tmp_path):
+
+	path = str(tmp_path / "iso20022.snap")
+	snapshot.build_snapshot(iso20022, path)
+
+	yield path
+
+	parsers.use_snapshot(None)
+
+def test_parse_through_snapshot(snap_path):
+
+	from_package = parsers.parse_file(SAMPLE_MSG)
+
+	parsers.use_snapshot(snap_path)
+	from_snapshot = parsers.parse_file(SAMPLE_MSG)
+
+	# Rebuilt classes, with the same content and behaviour.
+	assert type(from_snapshot) is not type(from_package)
+	assert type(from_snapshot).__qualname__ == type(from_package).__qualname__
+	assert from_snapshot.validate()
+	assert from_snapshot == from_package
+
+def test_snapshot_lookup(snap_path):
+
+	snap = snapshot.SchemaSnapshot(snap_path)
+
+	assert snap.TEST_001_001_01.Document._field_defs[0].type is snap.Message
+	assert snap.ExternalCode4._values == frozenset(iso20022.ExternalCode4._values)
+
+	with pytest.raises(AttributeError):
+		snap.NoSuchClass
+
+def test_unknown_message_type():
+
+	with pytest.raises(parsers.ParseError):
+		parsers.get_message_class("{urn:iso:std:iso:20022:tech:xsd:nope.001.001.01}Document")
+
+	assert parsers.get_message_class("{urn:iso:std:iso:20022:tech:xsd:test.001.001.01}Document") is iso20022.TEST_001_001_01.Document
@@ -0,0 +1,141 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+"""
+Stress tests for handling separate messages from separate threads. Every
+operation is run single-threaded first, then from many threads at once,
+and the results have to match.
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import iso20022
+import parsers
+from exceptions import ValidateError
+from conftest import SAMPLE_MSG
+
+THREADS = 16
+ROUNDS = 8
+
+@pytest.fixture(autouse=True)
+def interleave():
+
+	# Switch threads as often as possible, to shake out races.
+	old = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)
+	yield
+	sys.setswitchinterval(old)
+
+@pytest.fixture(scope="module")
+def messages():
+
+	with open(SAMPLE_MSG) as f:
+		sample = f.read()
+
+	xmls = []
+	for i in range(40):
+		xml = sample.replace("E2E-0001", f"E2E-{i:04d}").replace("1250.50", f"{i}.25")
+		# Some invalid ones too.
+		if i % 5 == 0:
+			xml = xml.replace("ACCP", "NOPE")
+		if i % 7 == 0:
+			xml = xml.replace("<NbOfTxs>2</NbOfTxs>", "")
+		xmls.append(xml)
+
+	return xmls
+
+def __validate_result__(msg):
+	try:
+		return msg.validate()
+	except ValidateError as e:
+		return str(e)
+
+def __process__(xml):
+
+	msg = parsers.parse_xml(xml)
+
+	before = msg.fingerprint()
+	validated = __validate_result__(msg)
+	out = msg.to_xml()
+
+	# Edit our own copy; nobody else's fingerprint should move.
+	msg.Msg.Tx[0].EndToEndId.set("EDITED")
+	after = msg.fingerprint()
+
+	return before, validated, out, after
+
+def __run_threaded__(fn, items):
+
+	with ThreadPoolExecutor(max_workers=THREADS) as executor:
+		return list(executor.map(fn, items))
+
+def test_parse_validate_to_xml(messages):
+
+	expected = [ __process__(xml) for xml in messages ]
+
+	for _ in range(ROUNDS):
+		assert __run_threaded__(__process__, messages) == expected
+
+def test_shared_message_read_only(messages):
+
+	# Reading (fingerprint, validate, to_xml) one message from many threads.
+	msg = parsers.parse_xml(messages[1])
+	expected = (msg.fingerprint(), __validate_result__(msg), msg.to_xml())
+	msg.invalidate_fingerprint()
+
+	def read(_):
+		return (msg.fingerprint(), __validate_result__(msg), msg.to_xml())
+
+	for _ in range(ROUNDS):
+		assert __run_threaded__(read, range(THREADS * 4)) == [expected] * (THREADS * 4)
+
+def test_parse_files(messages, tmp_path):
+
+	paths = []
+	for i, xml in enumerate(messages):
+		path = tmp_path / f"msg-{i}.xml"
+		path.write_text(xml)
+		paths.append(str(path))
+
+	expected = [ msg.fingerprint() for msg in (parsers.parse_file(path) for path in paths) ]
+
+	for _ in range(ROUNDS):
+		assert [ msg.fingerprint() for msg in parsers.parse_files(paths, max_workers=THREADS) ] == expected
+
+	valid = [ path for path, xml in zip(paths, messages) if "NOPE" not in xml and "NbOfTxs" in xml ]
+	assert all(msg.validate() for msg in parsers.parse_files(valid, validate=True, max_workers=THREADS))
+
+def test_generate():
+
+	def generate(_):
+		msg = iso20022.TEST_001_001_01.Document("Document")
+		msg.generate()
+		return msg
+
+	for _ in range(ROUNDS):
+		for msg in __run_threaded__(generate, range(THREADS * 4)):
+			assert msg.validate()
+			# Each generated message hashes the same however it's read.
+			msg.invalidate_fingerprint()
+			assert __run_threaded__(lambda _: msg.fingerprint(), range(4)) == [msg.fingerprint()] * 4
+
+def test_snapshot_cold_start(messages, tmp_path):
+
+	# Classes are built from the snapshot on first use, so start each
+	# round from a fresh one and have every thread race to build them.
+	import snapshot
+
+	path = str(tmp_path / "iso20022.snap")
+	snapshot.build_snapshot(iso20022, path)
+
+	expected = [ __process__(xml) for xml in messages ]
+
+	try:
+		for _ in range(ROUNDS * 4):
+			parsers.use_snapshot(path)
+			assert __run_threaded__(__process__, messages) == expected
+	finally:
+		parsers.use_snapshot(None)
@@ -0,0 +1,127 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import threading
+
+import pytest
+
+import iso20022
+import parsers
+import validation
+import mutate
+from conftest import SAMPLE_MSG, SCHEMA_DIR
+
+NS = "urn:iso:std:iso:20022:tech:xsd:test.001.001.01"
+
+@pytest.fixture
+def msg():
+	return parsers.parse_file(SAMPLE_MSG)
+
+def test_valid_message(msg):
+
+	assert validation.validate_batched(msg) == []
+
+def test_paths_name_array_entries(msg):
+
+	msg.Msg.Tx[1].EndToEndId.set("x" * 36)
+	msg.Msg.Tx[0].Rmt[1].set("")
+	msg.Msg.GrpHdr.MsgId.set("y" * 36)
+
+	issues = validation.validate_batched(msg)
+
+	assert sorted(issue.path for issue in issues) == [
+		"Document.Msg.GrpHdr.MsgId",
+		"Document.Msg.Tx[0].Rmt[1]",
+		"Document.Msg.Tx[1].EndToEndId",
+	]
+	assert all(issue.message == "Invalid value" for issue in issues)
+
+def test_structure_paths_name_array_entries(msg):
+
+	msg.Msg.Tx[1].EndToEndId = None
+
+	assert validation.validate_batched(msg) == [
+		validation.ValidationIssue("Document.Msg.Tx[1]", "Missing required field EndToEndId"),
+	]
+
+def test_validate_many(msg):
+
+	other = parsers.parse_file(SAMPLE_MSG)
+	other.Msg.Tx[0].Amt.set(-1)
+
+	assert validation.validate_batched([msg, other]) == [
+		validation.ValidationIssue("Document.Msg.Tx[0].Amt", "Invalid value"),
+	]
+
+@pytest.fixture
+def schemas(monkeypatch):
+
+	pytest.importorskip("lxml")
+
+	monkeypatch.setattr(validation, "SCHEMA_DIR", SCHEMA_DIR)
+	monkeypatch.setattr(validation, "_schema_cache", threading.local())
+
+def __generated__(count):
+
+	msgs = []
+	for _ in range(count):
+		msg = iso20022.TEST_001_001_01.Document("Document", ns=NS)
+		msg.generate()
+		msgs.append(mutate.compact_xml(msg))
+
+	return msgs
+
+def test_xsd_needs_a_schema(monkeypatch, tmp_path):
+
+	pytest.importorskip("lxml")
+
+	monkeypatch.setattr(validation, "SCHEMA_DIR", str(tmp_path))
+	monkeypatch.setattr(validation, "_schema_cache", threading.local())
+
+	with open(SAMPLE_MSG, "rb") as f:
+		xml = f.read()
+
+	with pytest.raises(validation.ValidateError):
+		validation.validate_xml(xml, engine="xsd")
+
+def test_engines_agree_on_missing_element(schemas, msg):
+
+	msg.Msg.GrpHdr.CreDtTm = None
+	msg.Msg.Tx[1].EndToEndId = None
+	xml = mutate.compact_xml(msg)
+
+	for engine in ("python", "xsd"):
+		assert [ issue.path for issue in validation.validate_xml(xml, engine=engine) ] == [
+			"Document.Msg.GrpHdr",
+			"Document.Msg.Tx[1]",
+		]
+
+def test_engines_agree_on_leaf_paths(schemas, msg):
+
+	msg.Msg.Tx[0].Rmt[1].set("x" * 36)
+	msg.Msg.Tx[1].Sts.set("NOPE")
+	xml = mutate.compact_xml(msg)
+
+	for engine in ("python", "xsd"):
+		assert [ issue.path for issue in validation.validate_xml(xml, engine=engine) ] == [
+			"Document.Msg.Tx[0].Rmt[1]",
+			"Document.Msg.Tx[1].Sts",
+		]
+
+def test_engines_agree_on_generated_messages(schemas):
+
+	for xml in __generated__(200):
+		assert validation.validate_xml(xml, engine="python") == []
+		assert validation.validate_xml(xml, engine="xsd") == []
+
+@pytest.mark.parametrize("kind", mutate.MUTATIONS)
+def test_engines_agree_on_mutants(schemas, kind):
+
+	seeds = [ parsers.parse_xml(xml) for xml in __generated__(10) ] + [parsers.parse_file(SAMPLE_MSG)]
+
+	for mutant in mutate.Mutator(seeds, seed=0, kinds=(kind,)).mutants(300):
+		python_issues = validation.validate_xml(mutant.xml, engine="python")
+		xsd_issues = validation.validate_xml(mutant.xml, engine="xsd")
+
+		assert len(python_issues) == 1, (python_issues, mutant.xml)
+		assert [ issue.path for issue in xsd_issues ] == [ issue.path for issue in python_issues ], (xsd_issues, mutant.xml)
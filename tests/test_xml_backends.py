@@ -0,0 +1,183 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+"""
+Known XML attacks, fired at every available backend through parse,
+parse_string and iterparse. Entity declarations must be refused outright;
+nothing external (files, DTDs, XIncludes, network) may ever be read.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import parsers
+import xml_backends
+
+SECRET = "TOP-SECRET-CONTENT"
+
+BILLION_LAUGHS = """<?xml version="1.0"?>
+<!DOCTYPE lolz [
+<!ENTITY lol "lol">
+<!ENTITY lol2 "&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;">
+<!ENTITY lol3 "&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;">
+<!ENTITY lol4 "&lol3;&lol3;&lol3;&lol3;&lol3;&lol3;&lol3;&lol3;&lol3;&lol3;">
+<!ENTITY lol5 "&lol4;&lol4;&lol4;&lol4;&lol4;&lol4;&lol4;&lol4;&lol4;&lol4;">
+<!ENTITY lol6 "&lol5;&lol5;&lol5;&lol5;&lol5;&lol5;&lol5;&lol5;&lol5;&lol5;">
+<!ENTITY lol7 "&lol6;&lol6;&lol6;&lol6;&lol6;&lol6;&lol6;&lol6;&lol6;&lol6;">
+<!ENTITY lol8 "&lol7;&lol7;&lol7;&lol7;&lol7;&lol7;&lol7;&lol7;&lol7;&lol7;">
+<!ENTITY lol9 "&lol8;&lol8;&lol8;&lol8;&lol8;&lol8;&lol8;&lol8;&lol8;&lol8;">
+]>
+<Document><MsgId>&lol9;</MsgId></Document>
+"""
+
+EXTERNAL_ENTITY = """<?xml version="1.0"?>
+<!DOCTYPE d [<!ENTITY xxe SYSTEM "file://{secret_path}">]>
+<Document><MsgId>&xxe;</MsgId></Document>
+"""
+
+PARAMETER_ENTITY = """<?xml version="1.0"?>
+<!DOCTYPE d [<!ENTITY % pe SYSTEM "{url}/pe.dtd"> %pe;]>
+<Document><MsgId>&leak;</MsgId></Document>
+"""
+
+# (Without a DTD, &leak; in the body would just be a syntax error.)
+EXTERNAL_DTD = """<?xml version="1.0"?>
+<!DOCTYPE Document SYSTEM "{url}/external.dtd">
+<Document><MsgId>x</MsgId></Document>
+"""
+
+XINCLUDE = """<?xml version="1.0"?>
+<Document xmlns:xi="http://www.w3.org/2001/XInclude"><MsgId><xi:include href="file://{secret_path}" parse="text"/></MsgId></Document>
+"""
+
+# (payload, must it be refused outright?)
+PAYLOADS = {
+	"billion_laughs": (BILLION_LAUGHS, True),
+	"external_entity": (EXTERNAL_ENTITY, True),
+	"parameter_entity_file": (PARAMETER_ENTITY.replace("{url}", "file://{dtd_dir}"), True),
+	"parameter_entity_network": (PARAMETER_ENTITY, True),
+	"external_dtd_file": (EXTERNAL_DTD.replace("{url}", "file://{dtd_dir}"), False),
+	"external_dtd_network": (EXTERNAL_DTD, False),
+	"xinclude": (XINCLUDE, False),
+}
+
+# What the DTDs (on disk, or from the server) contain.
+LEAKY_DTD = f'<!ENTITY leak "{SECRET}"><!ATTLIST MsgId leak CDATA "{SECRET}">'
+
+@pytest.fixture(scope="module")
+def dtd_server():
+
+	# Serves DTDs that would leak the secret, and records every request.
+	requests = []
+
+	class Handler(BaseHTTPRequestHandler):
+
+		def do_GET(self):
+			requests.append(self.path)
+			body = LEAKY_DTD.encode()
+			self.send_response(200)
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			pass
+
+	server = HTTPServer(("127.0.0.1", 0), Handler)
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+
+	yield f"http://127.0.0.1:{server.server_address[1]}", requests
+
+	server.shutdown()
+	server.server_close()
+
+@pytest.fixture(params=xml_backends.available_backends())
+def backend(request):
+	return xml_backends._BACKENDS[request.param]()
+
+def __payload__(template, url, tmp_path):
+
+	secret_path = tmp_path / "secret.txt"
+	secret_path.write_text(SECRET)
+
+	for name in ("pe.dtd", "external.dtd"):
+		(tmp_path / name).write_text(LEAKY_DTD)
+
+	return template.format(url=url, secret_path=secret_path, dtd_dir=tmp_path)
+
+def __contents__(nodes):
+
+	# Everything a parsed document could have leaked into.
+	out = []
+	for node in nodes:
+		out.append(node.text or "")
+		out.append(node.tail or "")
+		out.extend(node.attrib.values())
+	return "".join(out)
+
+def __run__(backend, method, payload, path):
+
+	if method == "parse_string":
+		return __contents__(backend.parse_string(payload).getroot().iter())
+
+	with open(path, "w") as f:
+		f.write(payload)
+
+	if method == "parse":
+		return __contents__(backend.parse(str(path)).getroot().iter())
+
+	return __contents__(node for _, node in backend.iterparse(str(path)))
+
+@pytest.mark.parametrize("method", ["parse", "parse_string", "iterparse"])
+@pytest.mark.parametrize("name", sorted(PAYLOADS))
+def test_attack_payloads(backend, method, name, tmp_path, dtd_server):
+
+	url, requests = dtd_server
+	del requests[:]
+
+	template, must_refuse = PAYLOADS[name]
+	payload = __payload__(template, url, tmp_path)
+
+	if must_refuse:
+		with pytest.raises(Exception):
+			__run__(backend, method, payload, tmp_path / "payload.xml")
+	else:
+		try:
+			contents = __run__(backend, method, payload, tmp_path / "payload.xml")
+		except Exception:
+			# Refusing is fine too.
+			pass
+		else:
+			assert SECRET not in contents
+			assert "lol" not in contents
+
+	assert requests == []
+
+@pytest.mark.parametrize("name", sorted(PAYLOADS))
+def test_attack_payloads_via_parsers(backend, name, tmp_path, dtd_server, monkeypatch):
+
+	url, requests = dtd_server
+	monkeypatch.setattr(xml_backends, "_backend", backend)
+
+	payload = __payload__(PAYLOADS[name][0], url, tmp_path)
+
+	# None of these are valid messages, so they all have to be refused,
+	# and with our own error type.
+	with pytest.raises(parsers.ParseError) as e:
+		parsers.parse_xml(payload)
+
+	assert SECRET not in str(e.value)
+	assert requests == []
+
+def test_billion_laughs_is_refused_quickly(backend):
+
+	import time
+
+	start = time.perf_counter()
+	with pytest.raises(Exception):
+		backend.parse_string(BILLION_LAUGHS)
+
+	assert time.perf_counter() - start < 1
@@ -0,0 +1,317 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+import os
+import re
+import threading
+from collections import namedtuple
+
+import parsers
+import xml_backends
+from exceptions import ParseError, ValidateError
+from base_types import _BaseElemType, _BaseFieldType, _BaseDataType
+
+ValidationIssue = namedtuple("ValidationIssue", ["path", "message"])
+
+# Schemas are looked up by message type, e.g. schemas/pain.002.001.14.xsd
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas")
+
+# Compiled schemas keep their error log on the schema object, so each
+# thread gets its own.
+_schema_cache = threading.local()
+
+_lxml_backend = None
+
+def validate_xml(xml, engine="python"):
+
+	"""
+	Validate a raw message, returning a list of ValidationIssues (empty if
+	the message is valid).
+
+	engine="python" parses the message and checks it with validate_batched().
+	engine="xsd" checks the raw bytes against the bundled XSD for the
+	message's namespace, using lxml.
+
+	Both engines report every error at once.
+	"""
+
+	if engine == "python":
+		return __validate_python__(xml)
+	elif engine == "xsd":
+		return __validate_xsd__(xml)
+	else:
+		raise ValueError(f"Unknown validation engine {engine}")
+
+def __validate_python__(xml):
+
+	try:
+		msg = parsers.parse_xml(xml)
+	except ParseError as e:
+		return [__issue_from_error__(e)]
+
+	return validate_batched(msg)
+
+def validate_batched(msgs):
+
+	"""
+	Validate one message, or a list of messages, returning every problem
+	as a ValidationIssue rather than stopping at the first.
+
+	The structure of each message is checked as we walk it, but leaf
+	values are only collected. They are then checked one class at a time,
+	in a single loop per class (see _do_batch_validation), which is much
+	faster than validate() on large messages.
+
+	Paths name array entries by their (0-based) index, the same way as
+	you'd reach them from Python, e.g. Document.Msg.Tx[1].Amt
+	"""
+
+	if isinstance(msgs, _BaseElemType):
+		msgs = [msgs]
+
+	issues = []
+
+	# Leaf class -> ([leaves], [parent paths], [array indices]). Leaf
+	# paths are only built for the leaves that fail.
+	groups = {}
+	# As above, but with the full path of each attribute.
+	attrib_groups = {}
+	is_field_class = {}
+	# Classes whose definitions have been fully checked once.
+	checked_classes = set()
+
+	# (element, parent path, index if it's an array entry)
+	stack = [ (msg, None, None) for msg in reversed(msgs) ]
+
+	while stack:
+
+		elem, parent_path, index = stack.pop()
+		elem_class = type(elem)
+
+		if elem._attrib_defs is not None:
+			__collect_attribs__(elem, __path__(elem, parent_path, index), issues, attrib_groups)
+
+		try:
+			is_field = is_field_class[elem_class]
+		except KeyError:
+			is_field = is_field_class[elem_class] = issubclass(elem_class, _BaseFieldType)
+
+		if not is_field:
+			try:
+				leaves, parents, indices = groups[elem_class]
+			except KeyError:
+				leaves, parents, indices = groups[elem_class] = ([], [], [])
+			leaves.append(elem)
+			parents.append(parent_path)
+			indices.append(index)
+			continue
+
+		path = __path__(elem, parent_path, index)
+
+		# Quick structural check while queueing the children. If anything
+		# looks off, _structure_errors() works out exactly what.
+		suspicious = elem_class not in checked_classes
+		seen_mutex_groups = None
+
+		# (Reversed, so that children come off the stack in document order.)
+		for field_def in reversed(elem._field_defs):
+
+			field = getattr(elem, field_def.name, None)
+
+			if field is None:
+				if field_def.min:
+					suspicious = True
+				continue
+
+			if field_def.mutex_group is not None:
+				if seen_mutex_groups is None:
+					seen_mutex_groups = set()
+				elif field_def.mutex_group in seen_mutex_groups:
+					suspicious = True
+				seen_mutex_groups.add(field_def.mutex_group)
+
+			field_type = field_def.type
+
+			if field_def.array:
+				if type(field) != list:
+					suspicious = True
+					continue
+				if (field_def.min is not None and len(field) < field_def.min) or (field_def.max is not None and len(field) > field_def.max):
+					suspicious = True
+				for i in range(len(field)-1, -1, -1):
+					f = field[i]
+					if type(f) != field_type:
+						suspicious = True
+						if not isinstance(f, _BaseElemType):
+							continue
+					stack.append((f, path, i))
+			else:
+				if type(field) != field_type:
+					suspicious = True
+					if not isinstance(field, _BaseElemType):
+						continue
+				stack.append((field, path, None))
+
+		if suspicious:
+			checked_classes.add(elem_class)
+			for error in elem._structure_errors():
+				issues.append(ValidationIssue(path, error))
+
+	for leaf_class, (leaves, parents, indices) in groups.items():
+		if issubclass(leaf_class, _BaseDataType):
+			for i in leaf_class._do_batch_validation(leaves):
+				issues.append(ValidationIssue(__path__(leaves[i], parents[i], indices[i]), "Invalid value"))
+
+	for leaf_class, (leaves, paths) in attrib_groups.items():
+		if issubclass(leaf_class, _BaseDataType):
+			for i in leaf_class._do_batch_validation(leaves):
+				issues.append(ValidationIssue(paths[i], "Invalid value"))
+
+	return issues
+
+def __path__(elem, parent_path, index):
+
+	path = elem._whoami(parent_path)
+	return path if index is None else f"{path}[{index}]"
+
+def __collect_attribs__(elem, path, issues, groups):
+
+	for attrib_def in elem._attrib_defs:
+		this_attrib = elem.attrib.get(attrib_def.name)
+		if this_attrib is None:
+			if attrib_def.required:
+				issues.append(ValidationIssue(f"{path}[{attrib_def.name}]", "Missing required attribute"))
+		elif type(this_attrib) != attrib_def.type:
+			issues.append(ValidationIssue(f"{path}[{attrib_def.name}]", "Invalid value"))
+		else:
+			try:
+				leaves, paths = groups[type(this_attrib)]
+			except KeyError:
+				leaves, paths = groups[type(this_attrib)] = ([], [])
+			leaves.append(this_attrib)
+			paths.append(f"{path}[{attrib_def.name}]")
+
+	undefined_attribs = set(elem.attrib) - { attrib_def.name for attrib_def in elem._attrib_defs }
+	if len(undefined_attribs) > 0:
+		issues.append(ValidationIssue(path, f"Invalid attributes {', '.join(undefined_attribs)}"))
+
+def __issue_from_error__(e):
+
+	# Our errors look like "path : message"
+	path, sep, message = str(e).partition(" : ")
+	return ValidationIssue(path, message) if sep else ValidationIssue(None, str(e))
+
+def __lxml_backend__():
+
+	global _lxml_backend
+
+	if _lxml_backend is None:
+		try:
+			_lxml_backend = xml_backends.LxmlBackend()
+		except ImportError:
+			raise ValidateError("The xsd engine requires lxml")
+
+	return _lxml_backend
+
+def __validate_xsd__(xml):
+
+	try:
+		tree = __lxml_backend__().parse_string(xml)
+	except Exception as e:
+		return [ValidationIssue(None, str(e))]
+
+	root = tree.getroot()
+
+	ns = re.match(r"^\{([^{}]*)\}", root.tag)
+	if ns is None:
+		return [ValidationIssue(None, "Document has no namespace")]
+
+	schema = get_schema(ns.group(1))
+
+	if schema.validate(tree):
+		return []
+
+	# The message classes tell us which elements are arrays. (If we don't
+	# have them, any repeated element is taken to be one.)
+	try:
+		msg_class = parsers.get_message_class(root.tag)
+	except (ParseError, ImportError):
+		msg_class = None
+
+	return [ ValidationIssue(__xsd_path__(tree, entry, msg_class), entry.message) for entry in schema.error_log ]
+
+def __xsd_path__(tree, entry, msg_class):
+
+	# Report paths the same way as validate_batched(), e.g.
+	# Document.Msg.Tx[1].Amt
+	try:
+		node = tree.xpath(entry.path)[0]
+	except Exception:
+		return entry.path
+
+	# A child that's missing, out of order, or one too many is a problem
+	# with its parent's content, which is where validate_batched() reports it.
+	if "This element is not expected" in entry.message and node.getparent() is not None:
+		node = node.getparent()
+
+	path = __dotted_path__(node, msg_class)
+
+	attrib = re.match(r"^Element '[^']*', attribute '(?:\{[^}]*\})?([^']*)'", entry.message)
+	if attrib is not None:
+		path = f"{path}[{attrib.group(1)}]"
+
+	return path
+
+def __dotted_path__(node, msg_class):
+
+	nodes = list(reversed(list(node.iterancestors()))) + [node]
+
+	names = [nodes[0].tag.rsplit("}", 1)[-1]]
+	elem_class = msg_class
+
+	for n in nodes[1:]:
+
+		name = n.tag.rsplit("}", 1)[-1]
+
+		if elem_class is None:
+			is_array = any(True for _ in n.itersiblings(n.tag)) or any(True for _ in n.itersiblings(n.tag, preceding=True))
+		else:
+			field_def = next((fd for fd in getattr(elem_class, "_field_defs", None) or () if fd.name == name), None)
+			is_array = field_def is not None and field_def.array
+			elem_class = None if field_def is None else field_def.type
+
+		if is_array:
+			name = f"{name}[{sum(1 for _ in n.itersiblings(n.tag, preceding=True))}]"
+
+		names.append(name)
+
+	return ".".join(names)
+
+def get_schema(ns):
+
+	"""
+	Compiled XSD for a message namespace, e.g.
+	urn:iso:std:iso:20022:tech:xsd:pain.002.001.14
+	"""
+
+	cache = getattr(_schema_cache, "schemas", None)
+	if cache is None:
+		cache = _schema_cache.schemas = dict()
+
+	try:
+		return cache[ns]
+	except KeyError:
+		pass
+
+	from lxml import etree
+
+	msgtype = ns.rsplit(":", 1)[-1]
+	path = os.path.join(SCHEMA_DIR, f"{msgtype}.xsd")
+
+	if not os.path.exists(path):
+		raise ValidateError(f"No schema for messages of type {msgtype}")
+
+	schema = etree.XMLSchema(__lxml_backend__().parse(path))
+	cache[ns] = schema
+
+	return schema
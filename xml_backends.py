@@ -0,0 +1,171 @@
+# GPLv3.0 License.
+# See LICENSE.md file in the project root for full license information.
+
+"""
+XML parsing backends.
+
+Both backends protect against the usual etree attacks (entity expansion,
+external entities, network access, DTD loading). lxml is used when it's
+installed, as it's considerably faster on large messages; otherwise we
+fall back to defusedxml.
+"""
+
+import io
+import threading
+from xml.etree.ElementTree import ElementTree as _ElementTree
+
+import defusedxml.ElementTree as _defused_ET
+
+try:
+	from lxml import etree as _lxml_etree
+except ImportError:
+	_lxml_etree = None
+
+class _BaseXMLBackend(object):
+
+	name = None
+
+	def parse(self, source):
+
+		raise NotImplementedError("Base class cannot parse.")
+
+	def parse_string(self, xml):
+
+		raise NotImplementedError("Base class cannot parse.")
+
+	def iterparse(self, source, events=("end",)):
+
+		raise NotImplementedError("Base class cannot parse.")
+
+class DefusedXMLBackend(_BaseXMLBackend):
+
+	name = "defusedxml"
+
+	def parse(self, source):
+		return _defused_ET.parse(source)
+
+	def parse_string(self, xml):
+		return _ElementTree(_defused_ET.fromstring(xml))
+
+	def iterparse(self, source, events=("end",)):
+		return _defused_ET.iterparse(source, events=events)
+
+class LxmlBackend(_BaseXMLBackend):
+
+	name = "lxml"
+
+	_parser_options = dict(
+		resolve_entities=False,
+		no_network=True,
+		load_dtd=False,
+		dtd_validation=False,
+		huge_tree=False,
+		remove_comments=True,
+		remove_pis=True,
+	)
+
+	def __init__(self):
+
+		if _lxml_etree is None:
+			raise ImportError("lxml is not installed")
+
+		# lxml parsers shouldn't be shared between threads.
+		self._local = threading.local()
+
+	def _parser(self):
+
+		parser = getattr(self._local, "parser", None)
+		if parser is None:
+			parser = _lxml_etree.XMLParser(**self._parser_options)
+			self._local.parser = parser
+
+		return parser
+
+	def parse(self, source):
+
+		tree = _lxml_etree.parse(source, self._parser())
+		self._check_docinfo(tree)
+
+		return tree
+
+	def parse_string(self, xml):
+
+		# lxml won't take str input with an encoding declaration.
+		if type(xml) == str:
+			xml = xml.encode("utf-8")
+
+		tree = _lxml_etree.fromstring(xml, self._parser()).getroottree()
+		self._check_docinfo(tree)
+
+		return tree
+
+	def iterparse(self, source, events=("end",)):
+
+		checked = False
+
+		for event, node in _lxml_etree.iterparse(source, events=events, **self._parser_options):
+			# The DTD has been read by the time we see the first element.
+			if not checked:
+				self._check_docinfo(node.getroottree())
+				checked = True
+			yield event, node
+
+	def _check_docinfo(self, tree):
+
+		# Entities aren't expanded, but refuse them outright to match defusedxml.
+		dtd = tree.docinfo.internalDTD
+		if dtd is not None and any(True for _ in dtd.iterentities()):
+			raise ValueError("Entity declarations are forbidden")
+
+_BACKENDS = {
+	DefusedXMLBackend.name: DefusedXMLBackend,
+	LxmlBackend.name: LxmlBackend,
+}
+
+_backend = None
+
+def available_backends():
+	return [ name for name in _BACKENDS if name != LxmlBackend.name or _lxml_etree is not None ]
+
+def get_backend():
+
+	global _backend
+
+	if _backend is None:
+		_backend = LxmlBackend() if _lxml_etree is not None else DefusedXMLBackend()
+
+	return _backend
+
+def set_backend(name):
+
+	global _backend
+
+	try:
+		_backend = _BACKENDS[name]()
+	except KeyError:
+		raise ValueError(f"Unknown XML backend {name} (available: {', '.join(available_backends())})")
+
+	return _backend
+
+if __name__ == "__main__":
+
+	# Throughput comparison:
+	#   python xml_backends.py <file.xml> [runs]
+
+	import os
+	import sys
+	import time
+
+	path = sys.argv[1]
+	runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+	with open(path, "rb") as f:
+		data = f.read()
+
+	for name in available_backends():
+		backend = _BACKENDS[name]()
+		start = time.perf_counter()
+		for _ in range(runs):
+			backend.parse(io.BytesIO(data))
+		elapsed = time.perf_counter() - start
+		print(f"{name}: {runs * len(data) / elapsed / 1e6:.1f} MB/s ({elapsed / runs * 1000:.2f}ms per parse of {os.path.basename(path)})")